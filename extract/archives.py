@@ -0,0 +1,271 @@
+import gzip
+import io
+import json
+import mmap
+import os
+import struct
+import tarfile
+import zipfile
+from typing import Dict, Iterable, List, Tuple, Union
+
+
+# TEI files can be read from tar, zip and pack archives. A TEI file in an
+# archive is named <archive_file>/<member_name>, so the file name at the end
+# of the doc_id is the same as for an extracted file, e.g.
+# corpus.tar/0B6fwCt2wuMJ.1.grobid.tei.xml instead of TEI/0B6fwCt2wuMJ.1.grobid.tei.xml
+
+TEI_SUFFIX = '.tei.xml'
+GZIP_SUFFIX = '.gz'
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+ZIP_SUFFIX = '.zip'
+ZIP_LOCAL_HEADER_SIZE = 30
+# a pack is the TEI files concatenated in one file, with a JSON index next to
+# it that has the name, offset and length of each file
+PACK_SUFFIX = '.teipack'
+PACK_INDEX_SUFFIX = '.index.json'
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + (ZIP_SUFFIX, PACK_SUFFIX)
+
+# archives opened by this process, each archive is opened and indexed once
+ARCHIVES: Dict[str, 'TEIArchive'] = {}
+
+
+class TEIArchive:
+
+    def __init__(self, archive_file: str):
+        self.archive_file = archive_file
+        # archives opened before a worker process is forked are opened
+        # again in the worker, so that they don't share a file position
+        self.pid = os.getpid()
+        self.fh = open(archive_file, 'rb')
+        self.mm = None
+
+    def map_file(self):
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mm
+
+    def member_names(self) -> List[str]:
+        raise NotImplementedError
+
+    def read_member(self, member_name: str) -> bytes:
+        raise NotImplementedError
+
+    def get_member_size(self, member_name: str) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.fh.close()
+
+
+class TarArchive(TEIArchive):
+
+    def __init__(self, archive_file: str, members: Dict[str, tarfile.TarInfo] = None):
+        # Indexing a tar reads all member headers, for a compressed tar that
+        # means decompressing the whole archive. A worker process forked from
+        # a process that indexed the archive gets that index as members. A
+        # worker process that is spawned instead indexes the archive itself,
+        # and a worker reading a compressed tar decompresses it up to the
+        # last file it reads either way, so for runs with many workers an
+        # uncompressed tar or a pack is much faster than a compressed tar.
+        super().__init__(archive_file)
+        if archive_file.endswith('.tar'):
+            # members of an uncompressed tar are read as slices of the mapped file
+            self.tar = tarfile.open(fileobj=self.map_file(), mode='r:')
+        else:
+            # compressed members can only be streamed, reading them in archive
+            # order avoids decompressing the start of the archive again
+            self.tar = tarfile.open(fileobj=self.fh, mode='r:*')
+        if members is None:
+            members = {member.name: member for member in self.tar.getmembers() if member.isfile()}
+        self.members = members
+
+    def member_names(self) -> List[str]:
+        return list(self.members)
+
+    def read_member(self, member_name: str) -> bytes:
+        member = self.members[member_name]
+        if self.mm is not None:
+            return self.mm[member.offset_data:member.offset_data + member.size]
+        return self.tar.extractfile(member).read()
+
+    def get_member_size(self, member_name: str) -> int:
+        return self.members[member_name].size
+
+    def close(self):
+        self.tar.close()
+        super().close()
+
+
+class ZipArchive(TEIArchive):
+
+    def __init__(self, archive_file: str):
+        super().__init__(archive_file)
+        self.zip = zipfile.ZipFile(self.fh)
+        self.map_file()
+        self.members = {info.filename: info for info in self.zip.infolist() if info.is_dir() is False}
+
+    def member_names(self) -> List[str]:
+        return list(self.members)
+
+    def read_member(self, member_name: str) -> bytes:
+        info = self.members[member_name]
+        if info.compress_type != zipfile.ZIP_STORED:
+            return self.zip.read(info)
+        # an uncompressed member is a slice of the mapped file, after the
+        # local header with its variable length file name and extra field
+        name_length, extra_length = struct.unpack('<HH', self.mm[info.header_offset + 26:info.header_offset + 30])
+        start = info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length
+        return self.mm[start:start + info.file_size]
+
+    def get_member_size(self, member_name: str) -> int:
+        return self.members[member_name].file_size
+
+    def close(self):
+        self.zip.close()
+        super().close()
+
+
+class PackArchive(TEIArchive):
+
+    def __init__(self, archive_file: str):
+        super().__init__(archive_file)
+        self.map_file()
+        with open(archive_file + PACK_INDEX_SUFFIX, 'r') as fh:
+            self.members = {member_name: (offset, length) for member_name, offset, length in json.load(fh)}
+
+    def member_names(self) -> List[str]:
+        return list(self.members)
+
+    def read_member(self, member_name: str) -> bytes:
+        offset, length = self.members[member_name]
+        return self.mm[offset:offset + length]
+
+    def get_member_size(self, member_name: str) -> int:
+        return self.members[member_name][1]
+
+
+def is_archive(path: str) -> bool:
+    return path.endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+def get_archive(archive_file: str) -> TEIArchive:
+    archive = ARCHIVES.get(archive_file)
+    if archive is not None and archive.pid == os.getpid():
+        return archive
+    if archive_file.endswith(TAR_SUFFIXES):
+        # an archive of the parent process is opened again, with its index
+        archive = TarArchive(archive_file, members=archive.members if archive is not None else None)
+    elif archive_file.endswith(ZIP_SUFFIX):
+        archive = ZipArchive(archive_file)
+    elif archive_file.endswith(PACK_SUFFIX):
+        archive = PackArchive(archive_file)
+    else:
+        raise ValueError(f"unknown archive type of file '{archive_file}'")
+    ARCHIVES[archive_file] = archive
+    return archive
+
+
+def close_archives():
+    # archives stay open and mapped until they are closed, the extraction
+    # closes them at the end of a run
+    for archive_file, archive in list(ARCHIVES.items()):
+        if archive.pid == os.getpid():
+            archive.close()
+        del ARCHIVES[archive_file]
+
+
+def split_member_path(tei_file: str) -> Tuple[Union[str, None], Union[str, None]]:
+    # returns the archive file and member name of a TEI file in an archive,
+    # or (None, None) for any other file
+    for suffix in ARCHIVE_SUFFIXES:
+        start = tei_file.find(suffix + '/')
+        while start != -1:
+            end = start + len(suffix)
+            archive_file = tei_file[:end]
+            if archive_file in ARCHIVES or os.path.isfile(archive_file):
+                return archive_file, tei_file[end + 1:]
+            start = tei_file.find(suffix + '/', end)
+    return None, None
+
+
+def read_tei_bytes(tei_file: str) -> bytes:
+    archive_file, member_name = split_member_path(tei_file)
+    if archive_file is not None:
+        tei_data = get_archive(archive_file).read_member(member_name)
+        return gzip.decompress(tei_data) if member_name.endswith(GZIP_SUFFIX) else tei_data
+    if tei_file.endswith(GZIP_SUFFIX):
+        with gzip.open(tei_file, 'rb') as fh:
+            return fh.read()
+    with open(tei_file, 'rb') as fh:
+        return fh.read()
+
+
+def open_tei(tei_file):
+    # returns something ElementTree can parse: the path itself for a plain
+    # TEI file, the TEI bytes as a file object for a compressed file or a
+    # file in an archive. Anything else, e.g. a file object, is returned as is.
+    if isinstance(tei_file, str) is False:
+        return tei_file
+    if split_member_path(tei_file)[0] is None and tei_file.endswith(GZIP_SUFFIX) is False:
+        return tei_file
+    return io.BytesIO(read_tei_bytes(tei_file))
+
+
+def stat_tei(tei_file: str) -> Tuple[int, int]:
+    # size and modification time in ns, a file in an archive has the
+    # modification time of the archive
+    archive_file, member_name = split_member_path(tei_file)
+    if archive_file is not None:
+        stat = os.stat(archive_file)
+        return get_archive(archive_file).get_member_size(member_name), stat.st_mtime_ns
+    stat = os.stat(tei_file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def is_tei_name(name: str) -> bool:
+    # skips hidden files, like the ._ files macOS puts next to copied files
+    fname = os.path.basename(name)
+    return fname.startswith('.') is False and (fname.endswith(TEI_SUFFIX) or
+                                               fname.endswith(TEI_SUFFIX + GZIP_SUFFIX))
+
+
+def iter_tei_files(paths: Union[str, Iterable[str]]):
+    # Expand directories and archives in paths to the TEI files in them,
+    # other paths are passed on as they are. Files in a directory are sorted
+    # by name, files in an archive come in archive order.
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            fnames = sorted(entry.name for entry in os.scandir(path) if entry.is_file() and is_tei_name(entry.name))
+            yield from (os.path.join(path, fname) for fname in fnames)
+        elif is_archive(path):
+            archive = get_archive(path)
+            yield from (f"{path}/{member_name}" for member_name in archive.member_names() if is_tei_name(member_name))
+        else:
+            yield path
+
+
+def write_tei_pack(tei_files: Iterable[str], pack_file: str) -> int:
+    # concatenate TEI files into a pack, named by their file names, which
+    # have to be unique. The index is written last, so a pack without an
+    # index is incomplete.
+    if pack_file in ARCHIVES:
+        ARCHIVES.pop(pack_file).close()
+    index = []
+    names = set()
+    offset = 0
+    with open(pack_file, 'wb') as fh:
+        for tei_file in tei_files:
+            member_name = os.path.basename(tei_file)
+            if member_name in names:
+                raise ValueError(f"duplicate file name '{member_name}' in pack '{pack_file}'")
+            names.add(member_name)
+            tei_data = read_tei_bytes(tei_file)
+            fh.write(tei_data)
+            index.append([member_name, offset, len(tei_data)])
+            offset += len(tei_data)
+    with open(pack_file + PACK_INDEX_SUFFIX, 'w') as fh:
+        json.dump(index, fh)
+    return len(index)
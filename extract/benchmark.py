@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+import parse
+import parse_tei
+import parse_tei_stream
+import parse_text
+import sinks
+import synthetic_tei
+import xml_backend
+
+
+# document sizes to benchmark, from a short paper to a long one with deep nesting
+DOC_SIZES = {
+    'small': dict(num_sections=4, nesting_depth=0, num_paragraphs=2, num_sentences=4,
+                  refs_per_sentence=1, num_bibl_structs=20),
+    'medium': dict(num_sections=8, nesting_depth=1, num_paragraphs=4, num_sentences=6,
+                   refs_per_sentence=1, num_bibl_structs=60),
+    'large': dict(num_sections=12, nesting_depth=2, num_paragraphs=6, num_sentences=8,
+                  refs_per_sentence=2, num_bibl_structs=200),
+}
+
+CORPUS_SIZES = [10, 100]
+
+
+def get_git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() if result.returncode == 0 else None
+    except OSError:
+        return None
+
+
+def time_stages(tei_files: List[str], output_file: str) -> Dict[str, float]:
+    # time each stage of the tree engine separately, summed over the corpus
+    timings = {stage: 0.0 for stage in ['parse_tei_file', 'get_publication_metadata', 'tag_index',
+                                        'parse_sections', 'get_references', 'get_citation_rows',
+                                        'csv_write']}
+    all_rows = []
+    for tei_file in tei_files:
+        start = time.perf_counter()
+        tei_header, tei_text = parse_tei.parse_tei_file(tei_file)
+        timings['parse_tei_file'] += time.perf_counter() - start
+        start = time.perf_counter()
+        publication_metadata = parse.get_publication_metadata(tei_header)
+        timings['get_publication_metadata'] += time.perf_counter() - start
+        # the tag index is shared by parse_sections and get_references, so it is its own stage
+        start = time.perf_counter()
+        tag_index = parse_tei.TagIndex(tei_text)
+        timings['tag_index'] += time.perf_counter() - start
+        start = time.perf_counter()
+        sections = parse_text.parse_sections(tei_text, tag_index=tag_index)
+        timings['parse_sections'] += time.perf_counter() - start
+        start = time.perf_counter()
+        references = parse.get_references(tei_text, tag_index=tag_index)
+        timings['get_references'] += time.perf_counter() - start
+        start = time.perf_counter()
+        all_rows.extend(parse.get_citation_rows(tei_file, sections, references, publication_metadata))
+        timings['get_citation_rows'] += time.perf_counter() - start
+    start = time.perf_counter()
+    sinks.write_rows(all_rows, sinks.TSVSink(output_file, parse.CITATION_CONTEXT_COLUMNS))
+    timings['csv_write'] += time.perf_counter() - start
+    return timings
+
+
+def time_stream_parse(tei_files: List[str]) -> float:
+    start = time.perf_counter()
+    for tei_file in tei_files:
+        parse_tei_stream.parse_tei_stream(tei_file)
+    return time.perf_counter() - start
+
+
+def measure_end_to_end(tei_files: List[str], output_file: str, engine: str, repeats: int = 3):
+    # wall time and peak traced memory of a full make_citation_context_csv run.
+    # tracing slows down every allocation, so the time is measured in runs
+    # without tracing and the peak memory in a separate traced run.
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        num_rows = parse.make_citation_context_csv(tei_files, output_file, engine=engine)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        parse.make_citation_context_csv(tei_files, output_file, engine=engine)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(seconds), 'peak_memory_bytes': peak, 'num_rows': num_rows}
+
+
+def get_speedup(stage_seconds: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    # how many times faster lxml is than the standard library, per stage
+    if 'lxml' not in stage_seconds or 'stdlib' not in stage_seconds:
+        return {}
+    return {stage: seconds / stage_seconds['lxml'][stage] if stage_seconds['lxml'][stage] > 0 else None
+            for stage, seconds in stage_seconds['stdlib'].items()}
+
+
+def run_benchmark(doc_size: str, num_docs: int, work_dir: str, repeats: int = 3, seed: int = 0,
+                  backends: List[str] = None):
+    config = synthetic_tei.SyntheticTEIConfig(**DOC_SIZES[doc_size], seed=seed)
+    tei_dir = os.path.join(work_dir, f"{doc_size}_{num_docs}")
+    tei_files = synthetic_tei.write_synthetic_corpus(config, tei_dir, num_docs)
+    output_file = os.path.join(work_dir, 'citation_contexts.tsv')
+    stage_seconds, end_to_end = {}, {}
+    default_backend = xml_backend.get_backend()
+    try:
+        for backend in backends if backends else xml_backend.get_available_backends():
+            xml_backend.set_backend(backend)
+            # the fastest of the repeats is the least disturbed by other processes
+            stage_runs = [time_stages(tei_files, output_file) for _ in range(repeats)]
+            stages = {stage: min(run[stage] for run in stage_runs) for stage in stage_runs[0]}
+            stages['parse_tei_stream'] = min(time_stream_parse(tei_files) for _ in range(repeats))
+            stage_seconds[backend] = stages
+            end_to_end[backend] = {engine: measure_end_to_end(tei_files, output_file, engine, repeats=repeats)
+                                   for engine in ['tree', 'stream']}
+    finally:
+        xml_backend.set_backend(default_backend)
+    return {
+        'doc_size': doc_size,
+        'num_docs': num_docs,
+        'config': config.to_dict(),
+        'corpus_bytes': sum(os.path.getsize(tei_file) for tei_file in tei_files),
+        'stage_seconds': stage_seconds,
+        'lxml_speedup': get_speedup(stage_seconds),
+        'end_to_end': end_to_end,
+    }
+
+
+def run_benchmarks(doc_sizes: List[str], corpus_sizes: List[int], repeats: int = 3, seed: int = 0,
+                   backends: List[str] = None):
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for doc_size in doc_sizes:
+            for num_docs in corpus_sizes:
+                print(f"benchmarking {num_docs} {doc_size} documents")
+                results.append(run_benchmark(doc_size, num_docs, work_dir, repeats=repeats, seed=seed,
+                                             backends=backends))
+    return {
+        'git_commit': get_git_commit(),
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeats': repeats,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark citation context extraction on synthetic TEI')
+    parser.add_argument('--doc-sizes', nargs='+', default=list(DOC_SIZES), choices=list(DOC_SIZES))
+    parser.add_argument('--corpus-sizes', nargs='+', type=int, default=CORPUS_SIZES)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backends', nargs='+', choices=xml_backend.BACKENDS,
+                        help='XML backends to compare, by default all installed ones')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='JSON file to write the results to')
+    args = parser.parse_args()
+    report = run_benchmarks(args.doc_sizes, args.corpus_sizes, repeats=args.repeats, seed=args.seed,
+                            backends=args.backends)
+    with open(args.output, 'w') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Union
+
+import archives
+
+
+MANIFEST_FILE = 'manifest.json'
+ROWS_DIR = 'rows'
+
+
+def hash_file(file_path: str, block_size: int = 2 ** 20) -> str:
+    if archives.split_member_path(file_path)[0] is not None:
+        # a TEI file in an archive is hashed on its bytes, not the archive file
+        return hashlib.sha256(archives.read_tei_bytes(file_path)).hexdigest()
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def make_cache_key(content_hash: str, extractor_version: str, context_size: int,
+                   context_sizes: List[int] = None, context_chars: List[int] = None,
+                   layout: str = 'flat') -> str:
+    key_string = f"{content_hash}:{extractor_version}:{context_size}"
+    if context_sizes or context_chars:
+        # only extended when extra context windows are used, so that cache
+        # entries made without them stay valid
+        key_string += f":{context_sizes}:{context_chars}"
+    if layout != 'flat':
+        key_string += f":{layout}"
+    return hashlib.sha256(key_string.encode('utf-8')).hexdigest()
+
+
+def write_json_atomic(data, output_file: str):
+    # write to a temporary file first, so that a crash halfway through
+    # never leaves a truncated file behind
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w') as fh:
+        json.dump(data, fh)
+    os.replace(tmp_file, output_file)
+
+
+class ExtractionCache:
+
+    def __init__(self, cache_dir: str, extractor_version: str, context_size: int = 1,
+                 context_sizes: List[int] = None, context_chars: List[int] = None,
+                 layout: str = 'flat', save_every: int = 100):
+        self.cache_dir = cache_dir
+        self.extractor_version = extractor_version
+        self.context_size = context_size
+        self.context_sizes = context_sizes
+        self.context_chars = context_chars
+        self.layout = layout
+        self.save_every = save_every
+        self.manifest_file = os.path.join(cache_dir, MANIFEST_FILE)
+        self.rows_dir = os.path.join(cache_dir, ROWS_DIR)
+        os.makedirs(self.rows_dir, exist_ok=True)
+        self.manifest = self.read_manifest()
+        self.num_unsaved = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def read_manifest(self) -> Dict[str, dict]:
+        if os.path.exists(self.manifest_file) is False:
+            return {}
+        with open(self.manifest_file, 'r') as fh:
+            return json.load(fh)
+
+    def save_manifest(self):
+        write_json_atomic(self.manifest, self.manifest_file)
+        self.num_unsaved = 0
+
+    def get_content_hash(self, tei_file: str) -> Union[str, None]:
+        # only re-hash a file if its size or modification time changed since
+        # the manifest entry was made. A file that can't be read has no hash,
+        # it is left to the extraction to report the error.
+        try:
+            size, mtime_ns = archives.stat_tei(tei_file)
+            entry = self.manifest.get(tei_file)
+            if entry is not None and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                return entry['content_hash']
+            return hash_file(tei_file)
+        except (OSError, KeyError):
+            # KeyError is a file name that is not in its archive
+            return None
+
+    def get_cache_key(self, content_hash: str) -> str:
+        return make_cache_key(content_hash, self.extractor_version, self.context_size,
+                              context_sizes=self.context_sizes, context_chars=self.context_chars,
+                              layout=self.layout)
+
+    def get_rows_file(self, content_hash: str) -> str:
+        return os.path.join(self.rows_dir, f"{self.get_cache_key(content_hash)}.json")
+
+    def get_findings_file(self, content_hash: str) -> str:
+        return os.path.join(self.rows_dir, f"{self.get_cache_key(content_hash)}.findings.json")
+
+    def has_rows(self, content_hash: str) -> bool:
+        if content_hash is None:
+            return False
+        return os.path.exists(self.get_rows_file(content_hash))
+
+    def get_rows(self, tei_file: str, content_hash: str) -> Union[List[list], None]:
+        if self.has_rows(content_hash) is False:
+            return None
+        with open(self.get_rows_file(content_hash), 'r') as fh:
+            rows = json.load(fh)
+        # the same content can be cached under a different file name,
+        # the doc_id column always refers to the current file
+        for row in rows:
+            if self.layout == 'normalized':
+                # normalized records are [table_name, row] pairs
+                row[1][0] = tei_file
+            else:
+                row[0] = tei_file
+        self.update_manifest(tei_file, content_hash, len(rows))
+        return rows
+
+    def has_findings(self, content_hash: str) -> bool:
+        # only documents extracted with validation have findings in the cache
+        if content_hash is None:
+            return False
+        return os.path.exists(self.get_findings_file(content_hash))
+
+    def get_findings(self, content_hash: str) -> Union[List[dict], None]:
+        if self.has_findings(content_hash) is False:
+            return None
+        with open(self.get_findings_file(content_hash), 'r') as fh:
+            return json.load(fh)
+
+    def put_findings(self, content_hash: str, findings: List[dict]):
+        write_json_atomic(findings, self.get_findings_file(content_hash))
+
+    def put_rows(self, tei_file: str, content_hash: str, rows: List[list]):
+        # the rows file is written before the manifest entry, so a crashed
+        # run finds all documents it finished when it is resumed
+        write_json_atomic(rows, self.get_rows_file(content_hash))
+        self.update_manifest(tei_file, content_hash, len(rows))
+
+    def update_manifest(self, tei_file: str, content_hash: str, num_rows: int):
+        size, mtime_ns = archives.stat_tei(tei_file)
+        entry = {
+            'content_hash': content_hash,
+            'cache_key': self.get_cache_key(content_hash),
+            'extractor_version': self.extractor_version,
+            'context_size': self.context_size,
+            'context_sizes': self.context_sizes,
+            'context_chars': self.context_chars,
+            'layout': self.layout,
+            'num_rows': num_rows,
+            'size': size,
+            'mtime_ns': mtime_ns,
+        }
+        if self.manifest.get(tei_file) == entry:
+            return None
+        self.manifest[tei_file] = entry
+        self.num_unsaved += 1
+        if self.num_unsaved >= self.save_every:
+            self.save_manifest()
+
+    def close(self):
+        if self.num_unsaved > 0:
+            self.save_manifest()
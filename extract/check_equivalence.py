@@ -0,0 +1,109 @@
+import argparse
+import os
+import sys
+import tempfile
+from typing import Callable, Dict, List, Union
+
+import parse
+import synthetic_tei
+import tables
+import xml_backend
+
+
+# The extraction paths that have to give the same citation context file:
+# both engines, serial and with worker processes, both XML backends, a
+# re-run from the extraction cache and the normalized tables turned back into
+# the flat layout. Each is compared byte for byte with the tree engine run
+# serially with the standard library parser. The corpus includes papers
+# without a reference list.
+
+CORPUS_CONFIG = dict(num_sections=6, nesting_depth=2, num_paragraphs=3, num_sentences=5,
+                     refs_per_sentence=2, num_bibl_structs=40)
+
+NO_REFERENCES_CONFIG = dict(CORPUS_CONFIG, num_bibl_structs=0)
+
+
+def write_flat_from_tables(tei_files: List[str], output_file: str, work_dir: str):
+    table_dir = os.path.join(work_dir, 'tables')
+    parse.make_citation_context_tables(tei_files, table_dir)
+    tables.read_flat_citation_contexts(table_dir).to_csv(output_file, sep='\t', index=False)
+
+
+def write_cached_rerun(tei_files: List[str], output_file: str, work_dir: str):
+    # the first run fills the cache, the second only reads from it
+    cache_dir = os.path.join(work_dir, 'cache')
+    parse.make_citation_context_csv(tei_files, output_file, cache_dir=cache_dir)
+    parse.make_citation_context_csv(tei_files, output_file, cache_dir=cache_dir)
+
+
+def make_checks(num_workers: int) -> Dict[str, Callable]:
+    checks = {
+        'stream engine': lambda tei_files, output_file, work_dir: parse.make_citation_context_csv(
+            tei_files, output_file, engine='stream'),
+        'tree engine, workers': lambda tei_files, output_file, work_dir: parse.make_citation_context_csv(
+            tei_files, output_file, num_workers=num_workers, chunk_size=3),
+        'stream engine, workers': lambda tei_files, output_file, work_dir: parse.make_citation_context_csv(
+            tei_files, output_file, engine='stream', num_workers=num_workers, chunk_size=3),
+        'extraction cache': write_cached_rerun,
+        'normalized tables': write_flat_from_tables,
+    }
+    if 'lxml' in xml_backend.get_available_backends():
+        checks['lxml, tree engine'] = ('lxml', checks['tree engine, workers'])
+        checks['lxml, stream engine'] = ('lxml', checks['stream engine'])
+    return checks
+
+
+def get_first_difference(file_a: str, file_b: str) -> Union[str, None]:
+    with open(file_a, 'rb') as fh_a, open(file_b, 'rb') as fh_b:
+        lines_a, lines_b = fh_a.read().split(b'\n'), fh_b.read().split(b'\n')
+    for li, (line_a, line_b) in enumerate(zip(lines_a, lines_b)):
+        if line_a != line_b:
+            return f"line {li + 1}:\n  expected {line_a[:200]!r}\n  got      {line_b[:200]!r}"
+    if len(lines_a) != len(lines_b):
+        return f"expected {len(lines_a)} lines, got {len(lines_b)}"
+    return None
+
+
+def run_checks(num_docs: int = 12, num_workers: int = 2, seed: int = 0) -> Dict[str, Union[str, None]]:
+    # returns the first difference with the reference output per check, None if there is none
+    backend = xml_backend.get_backend()
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = synthetic_tei.SyntheticTEIConfig(**CORPUS_CONFIG, seed=seed)
+        tei_files = synthetic_tei.write_synthetic_corpus(config, os.path.join(work_dir, 'tei'), num_docs)
+        no_refs_config = synthetic_tei.SyntheticTEIConfig(**NO_REFERENCES_CONFIG, seed=seed)
+        tei_files += synthetic_tei.write_synthetic_corpus(no_refs_config, os.path.join(work_dir, 'tei_no_refs'), 2)
+        reference_file = os.path.join(work_dir, 'reference.tsv')
+        try:
+            xml_backend.set_backend('stdlib')
+            parse.make_citation_context_csv(tei_files, reference_file)
+            for ci, (name, check) in enumerate(make_checks(num_workers).items()):
+                check_backend, check = check if isinstance(check, tuple) else ('stdlib', check)
+                xml_backend.set_backend(check_backend)
+                check_dir = os.path.join(work_dir, f'check_{ci}')
+                os.makedirs(check_dir)
+                output_file = os.path.join(check_dir, 'citation_contexts.tsv')
+                check(tei_files, output_file, check_dir)
+                results[name] = get_first_difference(reference_file, output_file)
+        finally:
+            xml_backend.set_backend(backend)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that all extraction paths give the same '
+                                                 'citation contexts on a synthetic TEI corpus')
+    parser.add_argument('--num-docs', type=int, default=12)
+    parser.add_argument('--num-workers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    results = run_checks(num_docs=args.num_docs, num_workers=args.num_workers, seed=args.seed)
+    for name, difference in results.items():
+        print(f"{'ok' if difference is None else 'DIFFERENT'}: {name}")
+        if difference is not None:
+            print(difference)
+    sys.exit(0 if all(difference is None for difference in results.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
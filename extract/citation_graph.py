@@ -0,0 +1,289 @@
+import json
+import os
+from array import array
+from typing import Dict, Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import cache
+import parse
+from parse_text import normalize_section_title, normalize_top_section_title
+from planner import parse_doc_id
+
+
+GRAPH_FILE = 'graph.json'
+
+# the count matrix is stored as its CSR arrays and the per-section counts as
+# edges sorted by (citing, cited, section), each in a .npy file so that it can
+# be memory-mapped when the graph is loaded
+MATRIX_ARRAYS = ['indptr', 'indices', 'data']
+EDGE_ARRAYS = ['edge_citing', 'edge_cited', 'edge_section', 'edge_count']
+
+PAIR_COLUMNS = ['source_id', 'target_id', 'weight']
+
+# the citing paper of a row is by default the scholar_id in its doc_id, the
+# citing_id (the DOI in the TEI header) is often empty. Rows without a
+# scholar_id column, like the citation context file, get it from doc_id.
+CITING_COLUMN = 'scholar_id'
+
+def get_citing_source_column(columns: List[str], citing_column: str) -> str:
+    if citing_column == CITING_COLUMN and CITING_COLUMN not in columns:
+        return 'doc_id'
+    return citing_column
+
+
+def is_graph_id(node_id) -> bool:
+    # citations of references that are missing or have no id are left out
+    return isinstance(node_id, str) and node_id != '' and node_id != parse.MISSING_REFERENCE[0]
+
+
+class IdMap:
+
+    def __init__(self, ids: Iterable[str] = ()):
+        # ids get consecutive indexes in order of first appearance, so the
+        # index of an id stays the same when more citations are added
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        for node_id in ids:
+            self.add(node_id)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, node_id):
+        return node_id in self.index
+
+    def add(self, node_id: str) -> int:
+        if node_id not in self.index:
+            self.index[node_id] = len(self.ids)
+            self.ids.append(node_id)
+        return self.index[node_id]
+
+
+def get_pairs(matrix: sparse.csr_matrix, ids: List[str], min_weight: float = 0) -> pd.DataFrame:
+    # the upper triangle of a symmetric matrix like the co-citation matrix,
+    # as one row per pair with PAIR_COLUMNS, highest weight first
+    upper = sparse.triu(matrix, k=1).tocoo()
+    keep = upper.data > min_weight
+    pairs = pd.DataFrame({
+        'source_id': np.asarray(ids, dtype=object)[upper.row[keep]],
+        'target_id': np.asarray(ids, dtype=object)[upper.col[keep]],
+        'weight': upper.data[keep],
+    }, columns=PAIR_COLUMNS)
+    return pairs.sort_values('weight', ascending=False, kind='stable').reset_index(drop=True)
+
+
+class CitationGraph:
+
+    def __init__(self, citing_ids: List[str], cited_ids: List[str], section_titles: List[str],
+                 edges: Dict[str, np.ndarray], citations: sparse.csr_matrix = None):
+        # citations is the citing x cited matrix of citation counts, edges
+        # has the counts per top-level section, for weighting citations by section
+        self.citing_ids = citing_ids
+        self.cited_ids = cited_ids
+        self.section_titles = section_titles
+        self.edges = edges
+        self.shape = (len(citing_ids), len(cited_ids))
+        if citations is None:
+            citations = sparse.csr_matrix((edges['edge_count'].astype(np.float64),
+                                           (edges['edge_citing'], edges['edge_cited'])), shape=self.shape)
+        self.citations = citations
+
+    @property
+    def num_citations(self) -> int:
+        return int(self.edges['edge_count'].sum())
+
+    def get_citation_matrix(self, section_weights: Dict[str, float] = None, default_weight: float = 1.0,
+                            binary: bool = False) -> sparse.csr_matrix:
+        # Citation counts of each citing and cited pair. With section_weights,
+        # a citation counts with the weight of the normalized title of its
+        # top-level section, e.g. {'related work': 0.5, 'method': 2.0}, so a
+        # weight also applies to the subsections. Sections that are not in it
+        # count with default_weight. With binary, each cited pair counts once.
+        if section_weights is None:
+            matrix = self.citations
+        else:
+            section_weights = {normalize_section_title(title): weight for title, weight in section_weights.items()}
+            weights = np.array([section_weights.get(title, default_weight) for title in self.section_titles])
+            data = self.edges['edge_count'] * weights[self.edges['edge_section']]
+            matrix = sparse.csr_matrix((data, (self.edges['edge_citing'], self.edges['edge_cited'])),
+                                       shape=self.shape)
+            matrix.eliminate_zeros()
+        if binary:
+            matrix = matrix.copy()
+            matrix.data = np.ones_like(matrix.data)
+        return matrix
+
+    def get_cocitation_matrix(self, section_weights: Dict[str, float] = None, default_weight: float = 1.0,
+                              binary: bool = False) -> sparse.csr_matrix:
+        # cited x cited: the sum over citing papers of the product of the
+        # citation weights of both works. With binary, the number of citing
+        # papers that cite both.
+        matrix = self.get_citation_matrix(section_weights, default_weight=default_weight, binary=binary)
+        return remove_diagonal((matrix.T @ matrix).tocsr())
+
+    def get_coupling_matrix(self, section_weights: Dict[str, float] = None, default_weight: float = 1.0,
+                            binary: bool = False) -> sparse.csr_matrix:
+        # citing x citing bibliographic coupling: the sum over cited works of
+        # the product of the citation weights. With binary, the number of
+        # cited works in common.
+        matrix = self.get_citation_matrix(section_weights, default_weight=default_weight, binary=binary)
+        return remove_diagonal((matrix @ matrix.T).tocsr())
+
+    def get_cocitation_pairs(self, min_weight: float = 0, **kwargs) -> pd.DataFrame:
+        return get_pairs(self.get_cocitation_matrix(**kwargs), self.cited_ids, min_weight=min_weight)
+
+    def get_coupling_pairs(self, min_weight: float = 0, **kwargs) -> pd.DataFrame:
+        return get_pairs(self.get_coupling_matrix(**kwargs), self.citing_ids, min_weight=min_weight)
+
+    def save(self, graph_dir: str):
+        os.makedirs(graph_dir, exist_ok=True)
+        arrays = dict(zip(MATRIX_ARRAYS, [self.citations.indptr, self.citations.indices, self.citations.data]))
+        arrays.update(self.edges)
+        for name, values in arrays.items():
+            np.save(os.path.join(graph_dir, f'{name}.npy'), np.ascontiguousarray(values))
+        # the description is written last, a graph dir without it is incomplete
+        graph_info = {
+            'shape': list(self.shape),
+            'citing_ids': self.citing_ids,
+            'cited_ids': self.cited_ids,
+            'section_titles': self.section_titles,
+        }
+        cache.write_json_atomic(graph_info, os.path.join(graph_dir, GRAPH_FILE))
+
+
+def remove_diagonal(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    # the co-citation of a work with itself is not a pair
+    matrix = matrix - sparse.diags(matrix.diagonal(), format='csr')
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def load_citation_graph(graph_dir: str, mmap: bool = True) -> CitationGraph:
+    # with mmap, the arrays are memory-mapped read-only instead of read,
+    # so loading takes no time and pages are read when they are used
+    with open(os.path.join(graph_dir, GRAPH_FILE), 'r') as fh:
+        graph_info = json.load(fh)
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(graph_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+              for name in MATRIX_ARRAYS + EDGE_ARRAYS}
+    citations = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                  shape=tuple(graph_info['shape']), copy=False)
+    edges = {name: arrays[name] for name in EDGE_ARRAYS}
+    return CitationGraph(graph_info['citing_ids'], graph_info['cited_ids'], graph_info['section_titles'],
+                         edges, citations=citations)
+
+
+class CitationGraphBuilder:
+
+    def __init__(self, graph: CitationGraph = None, compact_every: int = 1000000):
+        # Citations are buffered as (citing, cited, section, count) indexes and
+        # merged into the distinct edges every compact_every citations, so
+        # memory follows the number of edges, not the number of citations.
+        # Starting from a graph extends it, with the same id indexes.
+        self.compact_every = compact_every
+        self.citing = IdMap(graph.citing_ids if graph is not None else ())
+        self.cited = IdMap(graph.cited_ids if graph is not None else ())
+        self.sections = IdMap(graph.section_titles if graph is not None else ())
+        if graph is not None:
+            self.edges = {name: np.array(graph.edges[name], dtype=np.int64) for name in EDGE_ARRAYS}
+        else:
+            self.edges = {name: np.zeros(0, dtype=np.int64) for name in EDGE_ARRAYS}
+        self.buffer = array('q')
+
+    def add(self, citing_id: str, cited_id: str, section_title: str = None, count: int = 1) -> bool:
+        if is_graph_id(citing_id) is False or is_graph_id(cited_id) is False:
+            return False
+        # citations are counted per top-level section, the level that section weights apply to
+        section_index = self.sections.add(normalize_top_section_title(section_title))
+        self.buffer.extend((self.citing.add(citing_id), self.cited.add(cited_id), section_index, count))
+        if len(self.buffer) >= 4 * self.compact_every:
+            self.compact()
+        return True
+
+    def register_rows(self, rows: Iterable[list], columns: List[str], citing_column: str = CITING_COLUMN,
+                      cited_column: str = 'cited_work_id', section_column: str = 'section_title'):
+        # pass rows through unchanged, adding the citation of each row
+        citing_source = get_citing_source_column(columns, citing_column)
+        citing_index = columns.index(citing_source)
+        cited_index = columns.index(cited_column)
+        section_index = columns.index(section_column)
+        doc_id, scholar_id = None, None
+        for row in rows:
+            citing_id = row[citing_index]
+            if citing_source != citing_column:
+                # rows come in per document, so doc_id is parsed once per document
+                if citing_id != doc_id:
+                    doc_id = citing_id
+                    scholar_id = parse_doc_id(doc_id)[0] if isinstance(doc_id, str) else None
+                citing_id = scholar_id
+            self.add(citing_id, row[cited_index], row[section_index])
+            yield row
+
+    def add_rows(self, rows: Iterable[list], columns: List[str], **kwargs):
+        for _ in self.register_rows(rows, columns, **kwargs):
+            pass
+
+    def add_dataframe(self, citations: pd.DataFrame, citing_column: str = CITING_COLUMN,
+                      cited_column: str = 'cited_work_id', section_column: str = 'section_title'):
+        columns = [get_citing_source_column(list(citations.columns), citing_column), cited_column, section_column]
+        self.add_rows(citations[columns].itertuples(index=False, name=None), columns,
+                      citing_column=citing_column, cited_column=cited_column, section_column=section_column)
+
+    def compact(self):
+        if len(self.buffer) == 0:
+            return None
+        added = np.frombuffer(self.buffer, dtype=np.int64).reshape(-1, 4)
+        self.buffer = array('q')
+        citing, cited, section, count = (np.concatenate([self.edges[name], added[:, ci]])
+                                         for ci, name in enumerate(EDGE_ARRAYS))
+        # sort by (citing, cited, section) and sum the counts of equal edges
+        order = np.lexsort((section, cited, citing))
+        citing, cited, section, count = citing[order], cited[order], section[order], count[order]
+        starts = np.flatnonzero(np.concatenate([
+            [True], (np.diff(citing) != 0) | (np.diff(cited) != 0) | (np.diff(section) != 0)
+        ])) if len(citing) > 0 else np.zeros(0, dtype=np.int64)
+        self.edges = {
+            'edge_citing': citing[starts],
+            'edge_cited': cited[starts],
+            'edge_section': section[starts],
+            'edge_count': np.add.reduceat(count, starts) if len(starts) > 0 else count,
+        }
+
+    def build(self) -> CitationGraph:
+        self.compact()
+        # indexes fit in int32 for any realistic corpus, which halves the size on disk
+        edges = {name: values.astype(np.int32) for name, values in self.edges.items()}
+        return CitationGraph(list(self.citing.ids), list(self.cited.ids), list(self.sections.ids), edges)
+
+
+def make_citation_graph(tei_files: Union[str, List[str]], graph_dir: str = None,
+                        num_workers: int = None, chunk_size: int = 10, engine: str = 'tree',
+                        citing_column: str = CITING_COLUMN, cited_column: str = 'cited_work_id',
+                        best_version_only: bool = False) -> CitationGraph:
+    # build the graph straight from the extraction rows, without a citation context file
+    builder = CitationGraphBuilder()
+    rows = parse.iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                    engine=engine, best_version_only=best_version_only)
+    builder.add_rows(rows, parse.CITATION_CONTEXT_COLUMNS, citing_column=citing_column, cited_column=cited_column)
+    graph = builder.build()
+    if graph_dir is not None:
+        graph.save(graph_dir)
+    return graph
+
+
+def read_citation_graph_csv(citation_context_file: str, graph_dir: str = None,
+                            citing_column: str = CITING_COLUMN, cited_column: str = 'cited_work_id',
+                            chunk_size: int = 100000) -> CitationGraph:
+    # only the graph columns of the citation context file are read, in chunks
+    builder = CitationGraphBuilder()
+    columns = [get_citing_source_column(parse.CITATION_CONTEXT_COLUMNS, citing_column), cited_column,
+               'section_title']
+    for chunk in pd.read_csv(citation_context_file, sep='\t', usecols=columns, dtype=str, chunksize=chunk_size):
+        builder.add_dataframe(chunk, citing_column=citing_column, cited_column=cited_column)
+    graph = builder.build()
+    if graph_dir is not None:
+        graph.save(graph_dir)
+    return graph
@@ -0,0 +1,93 @@
+import hashlib
+import re
+from typing import Dict, Iterable, List, Union
+
+import pandas as pd
+
+from records import Reference
+
+
+CITED_WORK_COLUMNS = [
+    'cited_work_id', 'cited_id', 'cited_title', 'cited_author', 'num_citations', 'num_docs'
+]
+
+# interned work ids per key, so a work that is cited in many documents
+# is hashed only once per process
+WORK_IDS: Dict[str, str] = {}
+
+
+def normalize_title(title: str) -> Union[str, None]:
+    if title is None:
+        return None
+    title = re.sub(r'[^\w\s]', ' ', title.lower())
+    title = ' '.join(title.split())
+    return title if title != '' else None
+
+
+def make_cited_work_key(ref: Union[Reference, dict], cited_title: str = None) -> Union[str, None]:
+    # the DOI is the most reliable key, then any other identifier, and
+    # as a last resort the normalized title
+    if isinstance(ref, Reference):
+        doi, idnos = ref.doi, ref.idno
+    else:
+        doi = ref.get('doi')
+        idnos = [(idno['type'], idno['value']) for idno in ref['idno']] if ref.get('idno') else None
+    if doi:
+        return f"doi:{doi.strip().lower()}"
+    if idnos:
+        for idno_type, value in idnos:
+            if value is not None and value.strip() != '':
+                return f"{idno_type.lower()}:{value.strip()}"
+    norm_title = normalize_title(cited_title)
+    if norm_title is not None:
+        return f"title:{norm_title}"
+    return None
+
+
+def make_cited_work_id(work_key: str) -> Union[str, None]:
+    # derived from the key only, so ids are the same across runs and
+    # worker processes without any shared state
+    if work_key is None:
+        return None
+    if work_key not in WORK_IDS:
+        WORK_IDS[work_key] = 'W' + hashlib.sha1(work_key.encode('utf-8')).hexdigest()[:16]
+    return WORK_IDS[work_key]
+
+
+class CitedWorkRegistry:
+
+    def __init__(self):
+        self.works: Dict[str, list] = {}
+        self.last_doc: Dict[str, str] = {}
+
+    def add(self, work_id: str, doc_id: str, cited_id: str = None, cited_title: str = None,
+            cited_author: str = None):
+        if work_id is None:
+            return None
+        if work_id not in self.works:
+            # the first record seen for a work is kept as its description
+            self.works[work_id] = [work_id, cited_id, cited_title, cited_author, 0, 0]
+        work = self.works[work_id]
+        work[4] += 1
+        if self.last_doc.get(work_id) != doc_id:
+            # rows come in per document, so a change of doc_id is a new citing document
+            work[5] += 1
+            self.last_doc[work_id] = doc_id
+
+    def register_rows(self, rows: Iterable[list], columns: List[str]):
+        # pass rows through unchanged, registering the cited work of each row
+        doc_index = columns.index('doc_id')
+        work_index = columns.index('cited_work_id')
+        id_index = columns.index('cited_id')
+        title_index = columns.index('cited_title')
+        author_index = columns.index('cited_author')
+        for row in rows:
+            self.add(row[work_index], row[doc_index], cited_id=row[id_index],
+                     cited_title=row[title_index], cited_author=row[author_index])
+            yield row
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(list(self.works.values()), columns=CITED_WORK_COLUMNS)
+
+    def write_tsv(self, cited_works_file: str):
+        self.to_dataframe().to_csv(cited_works_file, sep='\t', index=False)
@@ -0,0 +1,108 @@
+from typing import Dict, List, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import cache
+import parse
+import sinks
+from planner import parse_doc_id
+
+
+# columns with few distinct values compared to the number of rows,
+# stored with a dictionary of values and integer codes per row
+DICTIONARY_COLUMNS = {
+    'doc_id', 'scholar_id', 'version', 'citing_id', 'citing_author', 'citing_title',
+    'cited_id', 'cited_author', 'section_title', 'cited_work_id'
+}
+
+DOC_ID_COLUMNS = ['scholar_id', 'version']
+
+
+def make_schema(columns: List[str]) -> pa.Schema:
+    fields = []
+    for column in columns:
+        if column == 'cit_count':
+            fields.append(pa.field(column, pa.int64()))
+        elif column in DICTIONARY_COLUMNS:
+            fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+class ParquetSink(sinks.RowSink):
+
+    def __init__(self, output_file: str, columns: List[str], batch_size: int = 10000):
+        # each batch becomes a row group, so a reader with a filter on
+        # doc_id or scholar_id skips the row groups of other documents
+        super().__init__(columns=columns + DOC_ID_COLUMNS, batch_size=batch_size)
+        self.output_file = output_file
+        self.schema = make_schema(self.columns)
+        self.writer = pq.ParquetWriter(output_file, self.schema,
+                                       use_dictionary=sorted(DICTIONARY_COLUMNS & set(self.columns)))
+        self.doc_id_cache: Dict[str, Tuple[str, str]] = {}
+
+    def write_row(self, row: list):
+        doc_id = row[0]
+        if doc_id not in self.doc_id_cache:
+            # rows come in per document, only the current doc_id is kept
+            self.doc_id_cache = {doc_id: parse_doc_id(doc_id)}
+        super().write_row(row + list(self.doc_id_cache[doc_id]))
+
+    def write_batch(self, batch: List[list]):
+        arrays = []
+        for ci, field in enumerate(self.schema):
+            values = [row[ci] for row in batch]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        if self.writer is None:
+            return None
+        self.flush()
+        self.writer.close()
+        self.writer = None
+
+
+def make_citation_context_parquet(tei_files: List[str], parquet_file: str,
+                                  num_workers: int = None, chunk_size: int = 10,
+                                  batch_size: int = 10000, engine: str = 'tree',
+                                  context_size: int = 1, context_sizes: List[int] = None,
+                                  context_chars: List[int] = None, cache_dir: str = None,
+                                  best_version_only: bool = False):
+    # same rows as make_citation_context_csv, plus the scholar_id and version
+    # parsed from doc_id, written as a Parquet file
+    columns = parse.CITATION_CONTEXT_COLUMNS + parse.get_context_columns(context_sizes, context_chars)
+    sink = ParquetSink(parquet_file, columns, batch_size=batch_size)
+    if cache_dir is None:
+        rows = parse.iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                        engine=engine, context_size=context_size,
+                                        context_sizes=context_sizes, context_chars=context_chars,
+                                        best_version_only=best_version_only)
+        return sinks.write_rows(rows, sink)
+    with cache.ExtractionCache(cache_dir, parse.EXTRACTOR_VERSION, context_size=context_size,
+                               context_sizes=context_sizes,
+                               context_chars=context_chars) as extraction_cache:
+        rows = parse.iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                        engine=engine, extraction_cache=extraction_cache,
+                                        best_version_only=best_version_only)
+        return sinks.write_rows(rows, sink)
+
+
+def read_citation_contexts(parquet_file: str, columns: List[str] = None, filters=None,
+                           scholar_id: str = None, doc_id: str = None) -> pd.DataFrame:
+    # only the requested columns are read, and the filters are checked against
+    # the row group statistics so that non-matching row groups are skipped.
+    # filters use the pyarrow format, e.g. [('cited_id', '=', '10.1145/...')]
+    filters = list(filters) if filters else []
+    if scholar_id is not None:
+        filters.append(('scholar_id', '=', scholar_id))
+    if doc_id is not None:
+        filters.append(('doc_id', '=', doc_id))
+    table = pq.read_table(parquet_file, columns=columns, filters=filters if len(filters) > 0 else None)
+    return table.to_pandas()
@@ -0,0 +1,39 @@
+import os
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+import parse_tei
+import synthetic_tei
+
+
+# head numbers of a synthetic paper with three sections and one level of
+# subsections, mapped to titles as GROBID puts them in the head text
+NESTED_SECTION_TITLES = {
+    '1': '1 Introduction',
+    '1.1': '1.1 Motivation',
+    '2': '2 Related Work',
+    '2.1': '2.1 User Studies',
+    '3': '3 Related Work Revisited',
+    '3.1': '3.1 Query Logs',
+}
+
+
+@pytest.fixture
+def nested_section_tei_files(tmp_path):
+    # two papers, named <scholar_id>.<version>.grobid.tei.xml, with the
+    # sections of NESTED_SECTION_TITLES
+    tei_dir = tmp_path / 'nested_tei'
+    os.makedirs(tei_dir)
+    tei_files = []
+    for di in range(2):
+        config = synthetic_tei.SyntheticTEIConfig(num_sections=3, nesting_depth=1, num_paragraphs=2,
+                                                  num_sentences=3, num_bibl_structs=10, missing_target_rate=0,
+                                                  empty_ref_rate=0, seed=di)
+        tei = synthetic_tei.make_synthetic_tei(config)
+        for head in tei.iter(parse_tei.make_tei_tag('head')):
+            head.text = NESTED_SECTION_TITLES[head.attrib['n']]
+        tei_file = str(tei_dir / f"paper{di}.1.grobid.tei.xml")
+        ElementTree.ElementTree(tei).write(tei_file, encoding='UTF-8', xml_declaration=True)
+        tei_files.append(tei_file)
+    return tei_files
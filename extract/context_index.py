@@ -0,0 +1,217 @@
+import sqlite3
+from typing import Iterable, List, Tuple, Union
+
+import pandas as pd
+
+import cache
+import parse
+import sinks
+from parse_text import SECTION_PATH_SEPARATOR, normalize_section_path
+
+
+CONTEXT_TABLE = 'citation_contexts'
+FTS_TABLE = 'citation_contexts_fts'
+
+# the normalized section path of each row, so that a lookup of 'related work'
+# also finds '2 Related Work' and its subsection '2 Related Work -- 2.1 User
+# Studies', see parse_text.normalize_section_path
+SECTION_KEY_COLUMN = 'section_key'
+
+INDEX_COLUMNS = ['cited_id', 'citing_id', 'doc_id', 'cited_work_id', SECTION_KEY_COLUMN]
+
+FTS_COLUMNS = ['citation_sent', 'citation_context']
+
+
+def get_subsection_key_range(section_key: str) -> Tuple[str, str]:
+    # the keys of the subsections of a section all start with its key and
+    # the separator, so they sort from that prefix up to the prefix with its
+    # last character incremented, a range that the section_key index can scan
+    prefix = section_key + SECTION_PATH_SEPARATOR
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def make_create_statements(columns: List[str]) -> List[str]:
+    column_defs = ', '.join(f"{column} {'INTEGER' if column == 'cit_count' else 'TEXT'}"
+                            for column in columns + [SECTION_KEY_COLUMN])
+    # the full-text index has no copy of the text, it reads it from the
+    # context table by rowid (an external content table)
+    return [
+        f"CREATE TABLE IF NOT EXISTS {CONTEXT_TABLE} (rowid INTEGER PRIMARY KEY, {column_defs})",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({', '.join(FTS_COLUMNS)}, "
+        f"content='{CONTEXT_TABLE}', content_rowid='rowid')",
+    ]
+
+
+class SQLiteSink(sinks.RowSink):
+
+    def __init__(self, db_file: str, columns: List[str], batch_size: int = 10000):
+        # Each batch is inserted in one transaction, together with its
+        # full-text entries. The column indexes are made when the sink is
+        # closed, building them once is faster than updating them per row.
+        # Writing to an existing database replaces the rows of each document
+        # that is written again, so a re-run doesn't add duplicate rows, and
+        # keeps the rows of the other documents.
+        super().__init__(columns=columns, batch_size=batch_size)
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        with self.conn:
+            for statement in make_create_statements(columns):
+                self.conn.execute(statement)
+            # rows are only replaced in a database that had rows to begin with,
+            # looking them up by doc_id needs its index right away
+            self.replace_docs = self.conn.execute(f"SELECT 1 FROM {CONTEXT_TABLE} LIMIT 1").fetchone() is not None
+            if self.replace_docs:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {CONTEXT_TABLE}_doc_id ON {CONTEXT_TABLE} (doc_id)")
+        self.doc_ids = set()
+        self.doc_index = columns.index('doc_id')
+        self.section_index = columns.index('section_title')
+        insert_columns = columns + [SECTION_KEY_COLUMN]
+        self.insert_sql = (f"INSERT INTO {CONTEXT_TABLE} ({', '.join(insert_columns)}) "
+                           f"VALUES ({', '.join('?' for _ in insert_columns)})")
+        self.fts_sql = (f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                        f"SELECT rowid, {', '.join(FTS_COLUMNS)} FROM {CONTEXT_TABLE} WHERE rowid > ?")
+        # the entries of an external content table are deleted with the
+        # 'delete' command and the text they were made from
+        self.fts_delete_sql = (f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)}) "
+                               f"SELECT 'delete', rowid, {', '.join(FTS_COLUMNS)} FROM {CONTEXT_TABLE} "
+                               f"WHERE doc_id = ?")
+
+    def delete_docs(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            self.conn.execute(self.fts_delete_sql, (doc_id, ))
+            self.conn.execute(f"DELETE FROM {CONTEXT_TABLE} WHERE doc_id = ?", (doc_id, ))
+
+    def write_batch(self, batch: List[list]):
+        with self.conn:
+            # the rows of a document can span batches, only the first batch
+            # with a document replaces its old rows
+            new_doc_ids = {row[self.doc_index] for row in batch} - self.doc_ids
+            if self.replace_docs:
+                self.delete_docs(new_doc_ids)
+            self.doc_ids.update(new_doc_ids)
+            last_rowid = self.conn.execute(f"SELECT MAX(rowid) FROM {CONTEXT_TABLE}").fetchone()[0]
+            self.conn.executemany(self.insert_sql, (
+                row + [normalize_section_path(row[self.section_index])] for row in batch
+            ))
+            self.conn.execute(self.fts_sql, (last_rowid if last_rowid is not None else 0, ))
+
+    def close(self):
+        if self.conn is None:
+            return None
+        self.flush()
+        with self.conn:
+            for column in INDEX_COLUMNS:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {CONTEXT_TABLE}_{column} "
+                                  f"ON {CONTEXT_TABLE} ({column})")
+        self.conn.execute('ANALYZE')
+        self.conn.close()
+        self.conn = None
+
+
+def make_citation_context_db(tei_files: List[str], db_file: str,
+                             num_workers: int = None, chunk_size: int = 10,
+                             batch_size: int = 10000, engine: str = 'tree',
+                             context_size: int = 1, context_sizes: List[int] = None,
+                             context_chars: List[int] = None, cache_dir: str = None,
+                             best_version_only: bool = False):
+    # same rows as make_citation_context_csv, written to a SQLite database
+    # that CitationContextIndex queries without loading the whole file
+    columns = parse.CITATION_CONTEXT_COLUMNS + parse.get_context_columns(context_sizes, context_chars)
+    sink = SQLiteSink(db_file, columns, batch_size=batch_size)
+    if cache_dir is None:
+        rows = parse.iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                        engine=engine, context_size=context_size,
+                                        context_sizes=context_sizes, context_chars=context_chars,
+                                        best_version_only=best_version_only)
+        return sinks.write_rows(rows, sink)
+    with cache.ExtractionCache(cache_dir, parse.EXTRACTOR_VERSION, context_size=context_size,
+                               context_sizes=context_sizes,
+                               context_chars=context_chars) as extraction_cache:
+        rows = parse.iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                        engine=engine, extraction_cache=extraction_cache,
+                                        best_version_only=best_version_only)
+        return sinks.write_rows(rows, sink)
+
+
+class CitationContextIndex:
+
+    def __init__(self, db_file: str):
+        # read-only, so that queries never lock out a sink writing to the database
+        self.db_file = db_file
+        self.conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True)
+        self.columns = [info[1] for info in self.conn.execute(f"PRAGMA table_info({CONTEXT_TABLE})")
+                        if info[1] not in ('rowid', SECTION_KEY_COLUMN)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def query(self, cited_id: str = None, citing_id: str = None, doc_id: str = None,
+              cited_work_id: str = None, section: str = None, match: str = None,
+              columns: List[str] = None, limit: int = None, ranked: bool = True) -> pd.DataFrame:
+        # Rows matching all the given conditions, in insertion order. section
+        # matches the rows of that section and of its subsections on the
+        # normalized section path, e.g. 'Related Work' or 'related work --
+        # user studies'. match is an FTS5 query on citation_sent and
+        # citation_context, e.g. 'relevance NEAR feedback' or
+        # 'citation_sent: "user study"'. Matches are ordered by relevance,
+        # unless ranked is False: ranking scores every match before the limit
+        # applies, which is slow for a term in most of the rows.
+        columns = self.columns if columns is None else columns
+        for column in columns:
+            if column not in self.columns:
+                raise ValueError(f"unknown column '{column}', must be one of {self.columns}")
+        conditions, params = [], []
+        for column, value in [('cited_id', cited_id), ('citing_id', citing_id), ('doc_id', doc_id),
+                              ('cited_work_id', cited_work_id)]:
+            if value is not None:
+                conditions.append(f"{CONTEXT_TABLE}.{column} = ?")
+                params.append(value)
+        if section is not None:
+            section_key = f"{CONTEXT_TABLE}.{SECTION_KEY_COLUMN}"
+            conditions.append(f"({section_key} = ? OR ({section_key} >= ? AND {section_key} < ?))")
+            section = normalize_section_path(section)
+            params.extend([section, *get_subsection_key_range(section)])
+        select = ', '.join(f"{CONTEXT_TABLE}.{column}" for column in columns)
+        if match is not None:
+            sql = (f"SELECT {select} FROM {FTS_TABLE} JOIN {CONTEXT_TABLE} "
+                   f"ON {CONTEXT_TABLE}.rowid = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH ?")
+            params.insert(0, match)
+            order = f"ORDER BY bm25({FTS_TABLE})" if ranked else f"ORDER BY {FTS_TABLE}.rowid"
+        else:
+            sql = f"SELECT {select} FROM {CONTEXT_TABLE} WHERE 1"
+            order = f"ORDER BY {CONTEXT_TABLE}.rowid"
+        sql = ' AND '.join([sql] + conditions) + ' ' + order
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return pd.DataFrame(self.conn.execute(sql, params).fetchall(), columns=columns)
+
+    def get_cited_contexts(self, cited_id: str, section: str = None, **kwargs) -> pd.DataFrame:
+        return self.query(cited_id=cited_id, section=section, **kwargs)
+
+    def get_section_contexts(self, section: str, **kwargs) -> pd.DataFrame:
+        return self.query(section=section, **kwargs)
+
+    def search(self, match: str, **kwargs) -> pd.DataFrame:
+        return self.query(match=match, **kwargs)
+
+    def count(self, group_by: Union[str, List[str]] = 'cited_id') -> pd.DataFrame:
+        # number of citation contexts per value of the group_by columns, most first
+        group_by = [group_by] if isinstance(group_by, str) else group_by
+        for column in group_by:
+            if column not in self.columns + [SECTION_KEY_COLUMN]:
+                raise ValueError(f"unknown column '{column}', must be one of {self.columns}")
+        group_sql = ', '.join(group_by)
+        sql = (f"SELECT {group_sql}, COUNT(*) AS num_contexts FROM {CONTEXT_TABLE} "
+               f"GROUP BY {group_sql} ORDER BY num_contexts DESC")
+        return pd.DataFrame(self.conn.execute(sql).fetchall(), columns=group_by + ['num_contexts'])
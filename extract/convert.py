@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import os
+import urllib.error
+import urllib.request
+import uuid
+from typing import Callable, Iterable, List, Tuple, Union
+
+import parse
+import sinks
+
+
+# settings used when config.json leaves them out, the first four are the
+# settings the GROBID python client reads from the same file
+DEFAULT_CONFIG = {
+    'grobid_server': 'http://localhost:8070',
+    'batch_size': 1000,
+    'sleep_time': 5,
+    'timeout': 60,
+    'concurrency': 4,
+    'max_retries': 5,
+}
+
+GROBID_SERVICE = 'processFulltextDocument'
+
+# the same options as used with the GROBID client, raw citations and
+# sentence segmentation are needed for the citation contexts
+SERVICE_PARAMS = {
+    'consolidateCitations': '1',
+    'includeRawCitations': '1',
+    'segmentSentences': '1',
+}
+
+# GROBID answers 503 when all its workers are busy, the request can be sent again later
+RETRY_STATUS = {503}
+
+
+def read_config(config_file: str = None) -> dict:
+    config = dict(DEFAULT_CONFIG)
+    if config_file is not None:
+        with open(config_file, 'r') as fh:
+            config.update(json.load(fh))
+    return config
+
+
+def get_tei_file(pdf_file: str, tei_dir: str) -> str:
+    # the same naming as the GROBID client, <name>.pdf becomes <name>.grobid.tei.xml
+    fname = os.path.basename(pdf_file)
+    if fname.lower().endswith('.pdf'):
+        fname = fname[:-4]
+    return os.path.join(tei_dir, f"{fname}.grobid.tei.xml")
+
+
+def make_multipart_body(pdf_file: str, pdf_data: bytes, params: dict) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in params.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f'{value}\r\n'.encode('utf-8'))
+    fname = os.path.basename(pdf_file)
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="input"; filename="{fname}"\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n'.encode('utf-8'))
+    parts.append(pdf_data)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def post_pdf(service_url: str, pdf_file: str, timeout: float, params: dict = None) -> Tuple[int, bytes]:
+    # blocking request, run in a thread by the event loop
+    with open(pdf_file, 'rb') as fh:
+        pdf_data = fh.read()
+    body, content_type = make_multipart_body(pdf_file, pdf_data, params if params else SERVICE_PARAMS)
+    request = urllib.request.Request(service_url, data=body, method='POST',
+                                     headers={'Content-Type': content_type, 'Accept': 'application/xml'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as err:
+        return err.code, err.read()
+
+
+def write_tei_atomic(tei_data: bytes, tei_file: str):
+    # a crashed run never leaves a truncated TEI file that would be skipped next time
+    tmp_file = f"{tei_file}.tmp"
+    with open(tmp_file, 'wb') as fh:
+        fh.write(tei_data)
+    os.replace(tmp_file, tei_file)
+
+
+async def convert_pdf(pdf_file: str, tei_file: Union[str, None], config: dict):
+    # returns (pdf_file, tei_file, tei_data, error), retrying with a doubling
+    # wait as long as the server is busy. The TEI is not written to tei_file
+    # here, convert_pdfs writes it once the TEI has been handled.
+    service_url = f"{config['grobid_server'].rstrip('/')}/api/{GROBID_SERVICE}"
+    for attempt in range(config['max_retries'] + 1):
+        try:
+            status, content = await asyncio.to_thread(post_pdf, service_url, pdf_file, config['timeout'])
+        except OSError as err:
+            return pdf_file, tei_file, None, f"{err.__class__.__name__}: {err}"
+        if status == 200:
+            return pdf_file, tei_file, content, None
+        if status not in RETRY_STATUS:
+            return pdf_file, tei_file, None, f"HTTP {status}: {content[:200].decode('utf-8', 'replace')}"
+        if attempt < config['max_retries']:
+            await asyncio.sleep(config['sleep_time'] * 2 ** attempt)
+    return pdf_file, tei_file, None, f"HTTP 503: server still busy after {config['max_retries']} retries"
+
+
+async def convert_pdfs(pdf_files: Iterable[str], tei_dir: str = None, config: dict = None,
+                       force: bool = False, on_tei: Callable[[str, str, bytes], None] = None) -> List[tuple]:
+    # A fixed number of workers take PDFs from a bounded queue, so at most
+    # concurrency requests are open and at most batch_size PDFs are waiting,
+    # however long pdf_files is. PDFs with a TEI file in tei_dir are skipped
+    # unless force is True. Each converted TEI is passed to on_tei as
+    # (pdf_file, tei_file, tei_data) as soon as it comes back, and only
+    # written to tei_dir if on_tei succeeds, so that a PDF whose TEI failed
+    # in on_tei is converted again on the next run instead of being skipped.
+    config = read_config() if config is None else {**DEFAULT_CONFIG, **config}
+    if tei_dir is not None:
+        os.makedirs(tei_dir, exist_ok=True)
+    queue = asyncio.Queue(maxsize=config['batch_size'])
+    results = []
+
+    async def worker():
+        while True:
+            pdf_file = await queue.get()
+            tei_file = get_tei_file(pdf_file, tei_dir) if tei_dir is not None else None
+            try:
+                pdf_file, tei_file, tei_data, error = await convert_pdf(pdf_file, tei_file, config)
+                if error is None and on_tei is not None:
+                    on_tei(pdf_file, tei_file, tei_data)
+                if error is None and tei_file is not None:
+                    await asyncio.to_thread(write_tei_atomic, tei_data, tei_file)
+            except Exception as err:
+                # a failing on_tei or write must not stop the worker, or the queue is never emptied
+                error = f"{err.__class__.__name__}: {err}"
+            finally:
+                queue.task_done()
+            if error is not None:
+                print(f"error converting {pdf_file}: {error}")
+            results.append((pdf_file, tei_file, 'converted' if error is None else 'failed', error))
+
+    workers = [asyncio.create_task(worker()) for _ in range(config['concurrency'])]
+    try:
+        for pdf_file in pdf_files:
+            if tei_dir is not None and force is False and os.path.exists(get_tei_file(pdf_file, tei_dir)):
+                results.append((pdf_file, get_tei_file(pdf_file, tei_dir), 'skipped', None))
+                continue
+            # waits when the queue is full, so PDFs are only listed as fast as they are converted
+            await queue.put(pdf_file)
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return results
+
+
+def is_pdf_name(name: str) -> bool:
+    # skips hidden files, like the ._ files macOS puts next to copied files,
+    # which GROBID rejects, see archives.is_tei_name
+    fname = os.path.basename(name)
+    return fname.startswith('.') is False and fname.lower().endswith('.pdf')
+
+
+def convert_pdf_dir(pdf_dir: str, tei_dir: str, config_file: str = None, force: bool = False,
+                    citation_context_file: str = None, batch_size: int = 10000, **kwargs):
+    # Convert all PDFs in pdf_dir. With a citation_context_file, the citation
+    # contexts of each converted TEI are extracted straight from the response,
+    # without reading the TEI file back, and those of each skipped PDF from its
+    # existing TEI file, so that a re-run writes the contexts of all PDFs.
+    # Other settings in kwargs override those of the config file.
+    config = {**read_config(config_file), **kwargs}
+    pdf_files = (os.path.join(pdf_dir, fname) for fname in sorted(os.listdir(pdf_dir)) if is_pdf_name(fname))
+    if citation_context_file is None:
+        return asyncio.run(convert_pdfs(pdf_files, tei_dir, config=config, force=force))
+
+    def extract_tei(pdf_file: str, tei_file: str, tei_data: bytes):
+        doc_id = tei_file if tei_file is not None else get_tei_file(pdf_file, '')
+        sink.write_rows(parse.extract_citation_rows(doc_id, tei_data=tei_data))
+
+    with sinks.TSVSink(citation_context_file, parse.CITATION_CONTEXT_COLUMNS, batch_size=batch_size) as sink:
+        results = asyncio.run(convert_pdfs(pdf_files, tei_dir, config=config, force=force, on_tei=extract_tei))
+        skipped_files = [tei_file for pdf_file, tei_file, status, error in results if status == 'skipped']
+        sink.write_rows(parse.iter_citation_rows(skipped_files))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert PDFs to TEI with a GROBID server')
+    parser.add_argument('pdf_dir')
+    parser.add_argument('tei_dir')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--concurrency', type=int, help='number of requests to GROBID at the same time')
+    parser.add_argument('--force', action='store_true', help='also convert PDFs that already have TEI')
+    parser.add_argument('--citation-context-file', help='extract citation contexts to this TSV file')
+    args = parser.parse_args()
+    overrides = {'concurrency': args.concurrency} if args.concurrency is not None else {}
+    results = convert_pdf_dir(args.pdf_dir, args.tei_dir, config_file=args.config, force=args.force,
+                              citation_context_file=args.citation_context_file, **overrides)
+    for status in ['converted', 'skipped', 'failed']:
+        print(status, sum(1 for result in results if result[2] == status))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import hashlib
+import threading
+import xml.etree.ElementTree as ElementTree
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import convert
+import synthetic_tei
+
+
+class GrobidStubHandler(BaseHTTPRequestHandler):
+    # Imitates the processFulltextDocument service of GROBID. The TEI in the
+    # response is a synthetic document seeded from the request body, so the
+    # same PDF always gets the same TEI. The first num_busy requests for
+    # each PDF are answered with 503, like a GROBID server with all its workers busy.
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != f"/api/{convert.GROBID_SERVICE}":
+            return self.send_reply(404, b'unknown service')
+        if b'name="input"' not in body:
+            return self.send_reply(400, b'no input file')
+        # the PDF bytes sit between the file part header and the closing boundary
+        pdf_data = body.split(b'Content-Type: application/pdf\r\n\r\n', 1)[-1].rsplit(b'\r\n--', 1)[0]
+        pdf_hash = hashlib.sha1(pdf_data).hexdigest()
+        with self.server.lock:
+            self.server.num_requests += 1
+            num_tries = self.server.pdf_tries.get(pdf_hash, 0)
+            self.server.pdf_tries[pdf_hash] = num_tries + 1
+        if num_tries < self.server.num_busy:
+            return self.send_reply(503, b'')
+        config = synthetic_tei.SyntheticTEIConfig(**{**self.server.tei_config.to_dict(),
+                                                     'seed': int(pdf_hash[:8], 16)})
+        tei_data = ElementTree.tostring(synthetic_tei.make_synthetic_tei(config), encoding='UTF-8',
+                                        xml_declaration=True)
+        self.send_reply(200, tei_data, content_type='application/xml')
+
+    def send_reply(self, status: int, content: bytes, content_type: str = 'text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        return None
+
+
+def start_stub_server(port: int = 0, num_busy: int = 0,
+                      tei_config: synthetic_tei.SyntheticTEIConfig = None) -> ThreadingHTTPServer:
+    # serves in a background thread, with port 0 a free port is picked.
+    # The url to use as grobid_server is f"http://localhost:{server.server_port}",
+    # call server.shutdown() to stop it.
+    server = ThreadingHTTPServer(('localhost', port), GrobidStubHandler)
+    server.lock = threading.Lock()
+    server.num_busy = num_busy
+    server.num_requests = 0
+    server.pdf_tries = {}
+    server.tei_config = tei_config if tei_config is not None else synthetic_tei.SyntheticTEIConfig()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,194 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from cited_works import normalize_title
+
+
+LINK_COLUMNS = ['meta_index', 'link_type', 'title_sim']
+
+DOI_PREFIXES = ('https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/', 'http://dx.doi.org/', 'doi:')
+
+# index of the metadata in a worker process, set once by init_link_worker
+LINK_INDEX: Union['MetadataIndex', None] = None
+
+
+def normalize_doi(doi) -> Union[str, None]:
+    # cited_id is the DOI of a reference if it has one, and another identifier otherwise
+    if isinstance(doi, str) is False:
+        return None
+    doi = doi.strip().lower()
+    for prefix in DOI_PREFIXES:
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi if doi.startswith('10.') else None
+
+
+def normalize_link_title(title) -> Union[str, None]:
+    # titles in a DataFrame can be NaN instead of None
+    return normalize_title(title) if isinstance(title, str) else None
+
+
+def get_ngrams(title: str, ngram_size: int = 3) -> set:
+    padded = f" {title} "
+    return {padded[i:i + ngram_size] for i in range(len(padded) - ngram_size + 1)}
+
+
+class MetadataIndex:
+
+    def __init__(self, dois: List[str], titles: List[str], ngram_size: int = 3, max_df: int = 1000):
+        # DOIs are matched exactly. Titles are blocked on character n-grams:
+        # only metadata titles that share n-grams with a title are scored.
+        # n-grams in more than max_df titles, like ' th', don't narrow
+        # down the candidates and are skipped when looking them up.
+        self.ngram_size = ngram_size
+        self.max_df = max_df
+        self.titles = [normalize_link_title(title) for title in titles]
+        self.doi_positions: Dict[str, int] = {}
+        for pos, doi in enumerate(dois):
+            doi = normalize_doi(doi)
+            if doi is not None and doi not in self.doi_positions:
+                self.doi_positions[doi] = pos
+        postings = {}
+        self.num_ngrams = np.zeros(len(self.titles), dtype=np.int32)
+        for pos, title in enumerate(self.titles):
+            if title is None:
+                continue
+            ngrams = get_ngrams(title, ngram_size)
+            self.num_ngrams[pos] = len(ngrams)
+            for ngram in ngrams:
+                postings.setdefault(ngram, []).append(pos)
+        self.postings = {ngram: np.array(positions, dtype=np.int32) for ngram, positions in postings.items()}
+
+    def get_candidates(self, title: str, max_candidates: int = 10) -> np.ndarray:
+        # the metadata titles with the highest Dice overlap of n-grams
+        ngrams = get_ngrams(title, self.ngram_size)
+        lists = [self.postings[ngram] for ngram in ngrams
+                 if ngram in self.postings and len(self.postings[ngram]) <= self.max_df]
+        if len(lists) == 0:
+            return np.array([], dtype=np.int32)
+        candidates, num_shared = np.unique(np.concatenate(lists), return_counts=True)
+        dice = 2 * num_shared / (len(ngrams) + self.num_ngrams[candidates])
+        if len(candidates) > max_candidates:
+            # only the top max_candidates are needed, no full sort
+            top = np.argpartition(-dice, max_candidates - 1)[:max_candidates]
+            candidates, dice = candidates[top], dice[top]
+        return candidates[np.argsort(-dice, kind='stable')]
+
+
+def encode_titles(titles: List[str], pad: int) -> Tuple[np.ndarray, np.ndarray]:
+    # one row of code points per title, padded with a value that is not a code point
+    lengths = np.array([len(title) for title in titles], dtype=np.int32)
+    codes = np.full((len(titles), max(1, lengths.max(initial=0))), pad, dtype=np.int32)
+    for ti, title in enumerate(titles):
+        codes[ti, :len(title)] = np.frombuffer(title.encode('utf-32-le'), dtype=np.int32)
+    return codes, lengths
+
+
+def batch_edit_distance(titles_a: List[str], titles_b: List[str]) -> np.ndarray:
+    # Levenshtein distance of each pair (titles_a[i], titles_b[i]). The rows
+    # of the edit distance matrix are computed for all pairs at once. Within a
+    # row, substitutions and deletions are element-wise, and insertions are a
+    # running minimum, d[j] = min over k <= j of x[k] + (j - k).
+    codes_a, len_a = encode_titles(titles_a, -1)
+    codes_b, len_b = encode_titles(titles_b, -2)
+    num_pairs, max_len_b = codes_b.shape
+    cols = np.arange(max_len_b + 1, dtype=np.int32)
+    prev = np.tile(cols, (num_pairs, 1))
+    dist = len_b.copy()
+    row = np.empty((num_pairs, max_len_b + 1), dtype=np.int32)
+    for i in range(1, int(len_a.max(initial=0)) + 1):
+        row[:, 0] = i
+        np.minimum(prev[:, :-1] + (codes_a[:, i - 1:i] != codes_b), prev[:, 1:] + 1, out=row[:, 1:])
+        cur = np.minimum.accumulate(row - cols, axis=1) + cols
+        done = len_a == i
+        dist[done] = cur[done, len_b[done]]
+        prev = cur
+    return dist
+
+
+def get_title_sims(titles_a: List[str], titles_b: List[str], batch_size: int = 5000) -> np.ndarray:
+    # 1 - edit distance / length of the longest title, in batches to bound memory
+    sims = np.zeros(len(titles_a))
+    for start in range(0, len(titles_a), batch_size):
+        batch_a, batch_b = titles_a[start:start + batch_size], titles_b[start:start + batch_size]
+        dist = batch_edit_distance(batch_a, batch_b)
+        max_len = np.maximum([len(title) for title in batch_a], [len(title) for title in batch_b])
+        sims[start:start + batch_size] = 1 - dist / np.maximum(max_len, 1)
+    return sims
+
+
+def init_link_worker(index: MetadataIndex):
+    global LINK_INDEX
+    LINK_INDEX = index
+
+
+def link_queries(queries: List[Tuple[str, str]], min_title_sim: float = 0.6, max_candidates: int = 10,
+                 index: MetadataIndex = None) -> List[tuple]:
+    # Link (doi, title) queries to metadata positions. A DOI match always
+    # links, otherwise the most similar candidate title links if it is at
+    # least min_title_sim. Returns (position, link_type, title_sim) per query.
+    index = LINK_INDEX if index is None else index
+    pair_queries, pair_positions = [], []
+    doi_links = {}
+    for qi, (doi, title) in enumerate(queries):
+        if doi is not None and doi in index.doi_positions:
+            doi_links[qi] = index.doi_positions[doi]
+            positions = [doi_links[qi]]
+        elif title is not None:
+            positions = index.get_candidates(title, max_candidates=max_candidates)
+        else:
+            continue
+        for pos in positions:
+            if title is not None and index.titles[pos] is not None:
+                pair_queries.append(qi)
+                pair_positions.append(pos)
+    sims = get_title_sims([queries[qi][1] for qi in pair_queries], [index.titles[pos] for pos in pair_positions])
+    best = {}
+    for qi, pos, sim in zip(pair_queries, pair_positions, sims):
+        if qi not in best or sim > best[qi][1]:
+            best[qi] = (pos, sim)
+    links = []
+    for qi in range(len(queries)):
+        if qi in doi_links:
+            sim = best[qi][1] if qi in best else None
+            links.append((doi_links[qi], 'doi', sim))
+        elif qi in best and best[qi][1] >= min_title_sim:
+            links.append((best[qi][0], 'title', best[qi][1]))
+        else:
+            links.append((None, None, None))
+    return links
+
+
+def link_references(references: pd.DataFrame, metadata: pd.DataFrame, ref_doi_column: str = 'cited_id',
+                    ref_title_column: str = 'cited_title', meta_doi_column: str = 'meta_cited_doi',
+                    meta_title_column: str = 'meta_cited_title', min_title_sim: float = 0.6,
+                    max_candidates: int = 10, num_workers: int = None,
+                    chunk_size: int = 1000) -> pd.DataFrame:
+    # Link each extracted reference, e.g. a row of the citation contexts or
+    # of the cited works, to a row of the metadata. Returns a frame with the
+    # index of references and LINK_COLUMNS: the index label of the linked
+    # metadata row, how it was linked ('doi', 'title' or None) and the
+    # similarity of the normalized titles. Each distinct DOI and title is
+    # linked once, in chunks that are spread over num_workers processes.
+    index = MetadataIndex(metadata[meta_doi_column].tolist(), metadata[meta_title_column].tolist())
+    ref_keys = list(zip(references[ref_doi_column].map(normalize_doi),
+                        references[ref_title_column].map(normalize_link_title)))
+    queries = list(dict.fromkeys(ref_keys))
+    chunks = [queries[start:start + chunk_size] for start in range(0, len(queries), chunk_size)]
+    if num_workers is None:
+        chunk_links = [link_queries(chunk, min_title_sim, max_candidates, index=index) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=init_link_worker,
+                                 initargs=(index,)) as executor:
+            chunk_links = list(executor.map(link_queries, chunks, [min_title_sim] * len(chunks),
+                                            [max_candidates] * len(chunks)))
+    query_links = dict(zip(queries, (link for links in chunk_links for link in links)))
+    meta_labels = metadata.index
+    rows = []
+    for key in ref_keys:
+        pos, link_type, sim = query_links[key]
+        rows.append([meta_labels[pos] if pos is not None else None, link_type, sim])
+    return pd.DataFrame(rows, columns=LINK_COLUMNS, index=references.index)
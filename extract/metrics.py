@@ -0,0 +1,136 @@
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+import parse_bibl_data as parse_bib
+from records import Reference
+
+
+STAGES = ['parse', 'validate', 'sections', 'references', 'rows']
+
+COUNTERS = ['sentences', 'citations', 'missing_references', 'empty_refs_skipped', 'unknown_name_fields']
+
+
+def make_file_metrics(tei_file: str) -> dict:
+    # a plain dict, so that it can be sent back from a worker process
+    return {
+        'doc_id': tei_file,
+        'stage_seconds': {stage: 0.0 for stage in STAGES},
+        'counters': {counter: 0 for counter in COUNTERS},
+    }
+
+
+@contextmanager
+def stage_timer(file_metrics: dict, stage: str):
+    # no-op when instrumentation is off, i.e. file_metrics is None
+    if file_metrics is None:
+        yield None
+        return None
+    start = time.perf_counter()
+    try:
+        yield file_metrics
+    finally:
+        file_metrics['stage_seconds'][stage] += time.perf_counter() - start
+
+
+def count_unknown_name_fields(ref: Reference) -> int:
+    num_unknown = 0
+    for part in [ref.analytic, ref.monogr]:
+        if part is None:
+            continue
+        for author in part.authors:
+            if author.name is not None:
+                num_unknown += len(set(author.name) - parse_bib.KNOWN_NAME_FIELDS)
+    return num_unknown
+
+
+def count_document(file_metrics: dict, sections: List[dict], references: Dict[str, Reference]):
+    counters = file_metrics['counters']
+    for section in sections:
+        for para in section['paragraphs']:
+            counters['sentences'] += len(para['sentences'])
+            for sent in para['sentences']:
+                counters['empty_refs_skipped'] += sent.empty_citations
+                counters['citations'] += len(sent.citations)
+                for cit in sent.citations:
+                    if cit.reference_id not in references:
+                        counters['missing_references'] += 1
+    for ref in references.values():
+        counters['unknown_name_fields'] += count_unknown_name_fields(ref)
+
+
+class RunMetrics:
+
+    def __init__(self, metrics_file: str = None, log_file: str = None, num_slowest: int = 10):
+        self.metrics_file = metrics_file
+        self.num_slowest = num_slowest
+        self.log_fh = open(log_file, 'w') if log_file is not None else None
+        self.start_time = time.time()
+        self.end_time = None
+        self.num_files = 0
+        self.num_cached = 0
+        self.num_errors = 0
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}
+        self.counters = {counter: 0 for counter in COUNTERS}
+        self.file_seconds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def log(self, event: str, **fields):
+        # one JSON object per line, so the log can be read while the run goes on
+        if self.log_fh is None:
+            return None
+        record = {'time': time.time(), 'event': event, **fields}
+        self.log_fh.write(json.dumps(record) + '\n')
+        self.log_fh.flush()
+
+    def add_file(self, file_metrics: dict):
+        self.num_files += 1
+        for stage, seconds in file_metrics['stage_seconds'].items():
+            self.stage_seconds[stage] += seconds
+        for counter, count in file_metrics['counters'].items():
+            self.counters[counter] += count
+        self.file_seconds.append((sum(file_metrics['stage_seconds'].values()), file_metrics['doc_id']))
+        self.log('file_parsed', **file_metrics)
+
+    def add_cached_file(self, tei_file: str, num_rows: int):
+        self.num_files += 1
+        self.num_cached += 1
+        self.log('file_cached', doc_id=tei_file, num_rows=num_rows)
+
+    def add_error(self, tei_file: str, error: str):
+        self.num_errors += 1
+        self.log('file_error', doc_id=tei_file, error=error)
+
+    def summary(self) -> dict:
+        end_time = self.end_time if self.end_time is not None else time.time()
+        wall_seconds = end_time - self.start_time
+        slowest = sorted(self.file_seconds, reverse=True)[:self.num_slowest]
+        return {
+            'wall_seconds': wall_seconds,
+            'num_files': self.num_files,
+            'num_cached': self.num_cached,
+            'num_errors': self.num_errors,
+            'files_per_second': self.num_files / wall_seconds if wall_seconds > 0 else None,
+            'citations_per_second': self.counters['citations'] / wall_seconds if wall_seconds > 0 else None,
+            'stage_seconds': self.stage_seconds,
+            'counters': self.counters,
+            'slowest_files': [{'doc_id': doc_id, 'seconds': seconds} for seconds, doc_id in slowest],
+        }
+
+    def close(self):
+        if self.end_time is not None:
+            return None
+        self.end_time = time.time()
+        summary = self.summary()
+        self.log('run_finished', **summary)
+        if self.log_fh is not None:
+            self.log_fh.close()
+        if self.metrics_file is not None:
+            with open(self.metrics_file, 'w') as fh:
+                json.dump(summary, fh, indent=2)
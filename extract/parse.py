@@ -1,104 +1,480 @@
-from typing import List
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
 from xml.etree.ElementTree import Element
 
-import pandas as pd
-
+import archives
+import cache
+import cited_works
+import metrics
 import parse_tei
 import parse_bibl_data as parse_bib
+import parse_tei_stream
 import parse_text
+import planner
+import records
+import sinks
+import validate
+from parse_bibl_data import get_publication_metadata
+
+
+# bump this whenever a change to the extraction code changes the output rows,
+# so that results cached by an earlier version are not reused
+EXTRACTOR_VERSION = '3'
+
+CITATION_CONTEXT_COLUMNS = [
+    'doc_id', 'cit_count', 'citing_id', 'citing_author', 'citing_title',
+    'cited_id', 'cited_author', 'cited_title', 'cited_raw',
+    'citation_ref', 'citation_sent', 'citation_context', 'section_title', 'cited_work_id'
+]
+
+# the normalized layout stores each document, section, sentence and reference
+# once, citations point to them by id and character offsets
+CITATION_TABLE_COLUMNS = {
+    'documents': ['doc_id', 'citing_id', 'citing_author', 'citing_title'],
+    'sections': ['doc_id', 'section_id', 'section_title'],
+    'sentences': ['doc_id', 'sentence_id', 'section_id', 'para_id', 'sentence_index', 'text'],
+    'references': ['doc_id', 'reference_id', 'cited_id', 'cited_author', 'cited_title', 'cited_raw',
+                   'cited_work_id'],
+    'citations': ['doc_id', 'cit_count', 'sentence_id', 'reference_id', 'char_start', 'char_end'],
+}
 
+LAYOUTS = {'flat', 'normalized'}
 
-def get_references(root: Element):
+ENGINES = {'tree', 'stream'}
+
+# resolved info of a citation whose target is not in the references
+MISSING_REFERENCE = ('MISSING', None, None, None, None)
+
+
+def get_references(root: Element, tag_index: parse_tei.TagIndex = None):
+    if tag_index is None or root not in tag_index:
+        tag_index = parse_tei.TagIndex(root)
     refs = {}
-    list_bibl = parse_tei.get_element_by_tag(root, 'listBibl')
-    for bibl_struct in parse_tei.get_elements_by_tag(list_bibl, 'biblStruct'):
-        ref = parse_bib.get_ref_info(bibl_struct)
-        id_tag = parse_tei.make_tei_tag('id')
+    id_tag = parse_tei.make_tei_tag('id')
+    list_bibl = parse_tei.get_element_by_tag(root, 'listBibl', tag_index=tag_index)
+    if list_bibl is None:
+        # a paper without a reference list, its citations are all missing references
+        return refs
+    for bibl_struct in parse_tei.get_elements_by_tag(list_bibl, 'biblStruct', tag_index=tag_index):
+        ref = parse_bib.get_ref_info(bibl_struct, tag_index=tag_index)
         ref['bid_id'] = bibl_struct.attrib[id_tag]
-        refs[ref['bid_id']] = ref
+        refs[ref['bid_id']] = records.Reference.from_dict(ref)
     return refs
 
 
-def update_section_title(section_title, section):
-    if section['level'] is None:
-        pass
-    else:
-        if section['level'] <= len(section_title):
-            while section['level'] <= len(section_title):
-                section_title.pop(-1)
-        section_title.append(section['title'])
+def get_context_columns(context_sizes: List[int] = None, context_chars: List[int] = None):
+    # extra context columns next to the default citation_context column
+    columns = [f'citation_context_sent_{size}' for size in context_sizes] if context_sizes else []
+    if context_chars:
+        columns.extend([f'citation_context_char_{num_chars}' for num_chars in context_chars])
+    return columns
+
+
+def get_sentence_offsets(sent_texts: List[str]):
+    # start and end offsets of each sentence in the paragraph text made by
+    # joining the sentences with a single space
+    sent_starts, sent_ends = [], []
+    offset = 0
+    for sent_text in sent_texts:
+        sent_starts.append(offset)
+        offset += len(sent_text)
+        sent_ends.append(offset)
+        offset += 1
+    return sent_starts, sent_ends
+
+
+def get_sentence_window(para_text: str, sent_starts: List[int], sent_ends: List[int],
+                        sent_index: int, context_size: int):
+    start = sent_index - context_size if sent_index > context_size else 0
+    end = min(sent_index + 1 + context_size, len(sent_ends))
+    return para_text[sent_starts[start]:sent_ends[end - 1]]
+
+
+def resolve_reference(ref: Union[records.Reference, dict]) -> Tuple[str, str, str, str, str]:
+    cited_id, cited_title, cited_author, cited_raw = parse_bib.get_ref_cited_info(ref)
+    work_key = cited_works.make_cited_work_key(ref, cited_title)
+    return cited_id, cited_title, cited_author, cited_raw, cited_works.make_cited_work_id(work_key)
+
+
+def resolve_references(references: Dict[str, records.Reference]) -> Dict[str, tuple]:
+    # each reference is resolved once per document, rows then only look it up
+    return {reference_id: resolve_reference(ref) for reference_id, ref in references.items()}
 
 
 def get_para_citation_rows(doc_id: str, cit_count: int, para: dict,
-                           section_title: List[str], references: List[dict],
-                           publication_metadata: dict, context_size: int = 1):
+                           section_title: Sequence[str], resolved_refs: Dict[str, tuple],
+                           citing_info: tuple, context_size: int = 1,
+                           context_sizes: List[int] = None, context_chars: List[int] = None):
     rows = []
-    citing_id, citing_title, citing_author, citing_raw = parse_bib.get_ref_cited_info(publication_metadata)
-    for si, sent in enumerate(para['sentences']):
+    citing_id, citing_title, citing_author, citing_raw = citing_info
+    sentences = para['sentences']
+    # with the paragraph text and sentence offsets, each context window
+    # is a single slice instead of a join over the neighbouring sentences
+    sent_texts = [s.text for s in sentences]
+    para_text = ' '.join(sent_texts)
+    sent_starts, sent_ends = get_sentence_offsets(sent_texts)
+    section = parse_text.SECTION_PATH_SEPARATOR.join(section_title)
+    for si, sent in enumerate(sentences):
         # print(sent.keys())
-        start = si - context_size if si > context_size else 0
-        end = si + 1 + context_size
-        citation_context = ' '.join([s['text'] for s in para['sentences'][start:end]])
-        for cit in sent['citations']:
+        if len(sent.citations) == 0:
+            continue
+        citation_context = get_sentence_window(para_text, sent_starts, sent_ends, si, context_size)
+        sent_windows = [get_sentence_window(para_text, sent_starts, sent_ends, si, size)
+                        for size in context_sizes] if context_sizes else []
+        for cit in sent.citations:
             # print('cit:', cit)
-            if cit['reference_id'] in references:
-                ref = references[cit['reference_id']]
-                # print('ref:', ref)
-                cited_id, cited_title, cited_author, cited_raw = parse_bib.get_ref_cited_info(ref)
-            else:
-                # print('missing reference:', cit)
-                cited_id, cited_title, cited_author, cited_raw = 'MISSING', None, None, None
+            resolved_ref = resolved_refs.get(cit.reference_id, MISSING_REFERENCE)
+            cited_id, cited_title, cited_author, cited_raw, cited_work_id = resolved_ref
             cit_count += 1
             row = [
                 doc_id, cit_count,
                 citing_id, citing_author, citing_title,
                 cited_id, cited_author, cited_title, cited_raw,
-                cit['text'], sent['text'], citation_context, ' -- '.join(section_title)
+                cit.text, sent.text, citation_context, section, cited_work_id
             ]
-            # print('SECTION TITLE:', ' -- '.join(section_title))
+            row.extend(sent_windows)
+            if context_chars:
+                cit_start = sent_starts[si] + cit.char_index
+                cit_end = cit_start + len(cit.text)
+                row.extend([para_text[max(0, cit_start - num_chars):cit_end + num_chars]
+                            for num_chars in context_chars])
+            # print('SECTION TITLE:', section)
             rows.append(row)
-        # print(sent['text'])
+        # print(sent.text)
     return rows
 
 
-def get_citation_rows(tei_file: str, sections, references, publication_metadata):
-    section_title = []
+def get_citation_rows(tei_file: str, sections, references, publication_metadata,
+                      context_size: int = 1, context_sizes: List[int] = None,
+                      context_chars: List[int] = None):
     rows = []
     cit_count = 0
+    citing_info = parse_bib.get_ref_cited_info(publication_metadata)
+    resolved_refs = resolve_references(references)
     for section in sections:
-        update_section_title(section_title, section)
-        # print(section_title)
         for para in section['paragraphs']:
             para_rows = get_para_citation_rows(tei_file, cit_count, para,
-                                               section_title, references, publication_metadata)
+                                               section['section_path'], resolved_refs, citing_info,
+                                               context_size=context_size, context_sizes=context_sizes,
+                                               context_chars=context_chars)
             cit_count += len(para_rows)
             rows.extend(para_rows)
     return rows
 
 
-def make_citation_context_csv(tei_files: List[str], citation_context_file: str):
-    all_rows = []
-    for tei_file in tei_files:
-        print('parsing citation contexts for file', tei_file)
-        tei_header, tei_text = parse_tei.parse_tei_file(tei_file)
-        publication_metadata = get_publication_metadata(tei_header)
-        sections = parse_text.parse_sections(tei_text)
-        references = get_references(tei_text)
-        rows = get_citation_rows(tei_file, sections, references, publication_metadata)
-        all_rows.extend(rows)
-    columns = [
-        'doc_id', 'cit_count', 'citing_id', 'citing_author', 'citing_title',
-        'cited_id', 'cited_author', 'cited_title', 'cited_raw',
-        'citation_ref', 'citation_sent', 'citation_context', 'section_title'
-    ]
-    df = pd.DataFrame(all_rows, columns=columns)
-    df.to_csv(citation_context_file, sep='\t', index=False)
-
-
-def get_publication_metadata(tei_header: Element):
-    bibl_struct = parse_tei.get_element_by_tag(tei_header, 'biblStruct')
-    publication_metadata = parse_bib.get_ref_info(bibl_struct)
-    title_stmt = parse_tei.get_element_by_tag(tei_header, 'titleStmt')
-    publication_metadata['title'] = ' <> '.join([text.strip() for text in title_stmt.itertext() if text.strip() != ''])
-    return publication_metadata
+def get_citation_records(tei_file: str, sections, references, publication_metadata):
+    # rows for the normalized layout, as [table_name, row] pairs
+    table_rows = []
+    citing_id, citing_title, citing_author, citing_raw = parse_bib.get_ref_cited_info(publication_metadata)
+    table_rows.append(['documents', [tei_file, citing_id, citing_author, citing_title]])
+    for reference_id, resolved_ref in resolve_references(references).items():
+        cited_id, cited_title, cited_author, cited_raw, cited_work_id = resolved_ref
+        table_rows.append(['references', [tei_file, reference_id, cited_id, cited_author, cited_title, cited_raw,
+                                          cited_work_id]])
+    cit_count = 0
+    para_id = 0
+    sentence_id = 0
+    for section_id, section in enumerate(sections):
+        section_title = parse_text.SECTION_PATH_SEPARATOR.join(section['section_path'])
+        table_rows.append(['sections', [tei_file, section_id, section_title]])
+        for para in section['paragraphs']:
+            # context windows never cross paragraph boundaries, so only
+            # paragraphs with citations are needed to rebuild the contexts
+            if all(len(sent.citations) == 0 for sent in para['sentences']):
+                continue
+            for sent in para['sentences']:
+                table_rows.append(['sentences', [tei_file, sentence_id, section_id, para_id,
+                                                 sent.sentence_index, sent.text]])
+                for cit in sent.citations:
+                    cit_count += 1
+                    char_end = cit.char_index + len(cit.text)
+                    table_rows.append(['citations', [tei_file, cit_count, sentence_id, cit.reference_id,
+                                                     cit.char_index, char_end]])
+                sentence_id += 1
+            para_id += 1
+    return table_rows
+
+
+def extract_citation_rows(tei_file: str, engine: str = 'tree', context_size: int = 1,
+                          context_sizes: List[int] = None, context_chars: List[int] = None,
+                          layout: str = 'flat', findings: List[dict] = None,
+                          file_metrics: dict = None, tei_data: bytes = None):
+    # if a findings list is given, the TEI text is validated on the same
+    # parsed tree and the findings are added to it. If file_metrics is given,
+    # stage timings and counters are recorded in it. If tei_data is given,
+    # the TEI is parsed from those bytes and tei_file is only used as doc_id.
+    tei_source = tei_file if tei_data is None else io.BytesIO(tei_data)
+    if engine == 'stream':
+        if findings is not None:
+            raise ValueError("validation needs the parsed tree, use engine 'tree'")
+        # the stream engine parses sections and references during the parse stage
+        with metrics.stage_timer(file_metrics, 'parse'):
+            publication_metadata, sections, references = parse_tei_stream.parse_tei_stream(tei_source)
+    elif engine == 'tree':
+        with metrics.stage_timer(file_metrics, 'parse'):
+            tei_header, tei_text = parse_tei.parse_tei_file(tei_source)
+            publication_metadata = get_publication_metadata(tei_header)
+            # one tag index for the text, shared by the section and reference parsing
+            tag_index = parse_tei.TagIndex(tei_text)
+        if findings is not None:
+            with metrics.stage_timer(file_metrics, 'validate'):
+                findings.extend(validate.validate_tei_text(tei_text))
+        with metrics.stage_timer(file_metrics, 'sections'):
+            sections = parse_text.parse_sections(tei_text, tag_index=tag_index)
+        with metrics.stage_timer(file_metrics, 'references'):
+            references = get_references(tei_text, tag_index=tag_index)
+        # the parsed sections and references hold plain values only,
+        # so the tree can be released before the rows are made
+        del tei_header, tei_text, tag_index
+    else:
+        raise ValueError(f"unknown engine '{engine}', must be one of {sorted(ENGINES)}")
+    if file_metrics is not None:
+        metrics.count_document(file_metrics, sections, references)
+    with metrics.stage_timer(file_metrics, 'rows'):
+        if layout == 'normalized':
+            return get_citation_records(tei_file, sections, references, publication_metadata)
+        return get_citation_rows(tei_file, sections, references, publication_metadata,
+                                 context_size=context_size, context_sizes=context_sizes,
+                                 context_chars=context_chars)
+
+
+def extract_file(tei_file: str, engine: str = 'tree', context_size: int = 1,
+                 context_sizes: List[int] = None, context_chars: List[int] = None,
+                 layout: str = 'flat', validate_tei: bool = False, instrument: bool = False):
+    # errors are returned per file so that one malformed TEI file doesn't
+    # take down the rest of the run, in the serial path as well as in a worker
+    findings = [] if validate_tei else None
+    file_metrics = metrics.make_file_metrics(tei_file) if instrument else None
+    try:
+        rows = extract_citation_rows(tei_file, engine=engine, context_size=context_size,
+                                     context_sizes=context_sizes, context_chars=context_chars,
+                                     layout=layout, findings=findings, file_metrics=file_metrics)
+        return tei_file, rows, None, findings, file_metrics
+    except Exception as err:
+        return tei_file, None, f"{err.__class__.__name__}: {err}", None, None
+
+
+def extract_citation_rows_chunk(tei_files: List[str], engine: str = 'tree', context_size: int = 1,
+                                context_sizes: List[int] = None, context_chars: List[int] = None,
+                                layout: str = 'flat', validate_tei: bool = False,
+                                instrument: bool = False):
+    # runs in a worker process
+    return [extract_file(tei_file, engine=engine, context_size=context_size, context_sizes=context_sizes,
+                         context_chars=context_chars, layout=layout, validate_tei=validate_tei,
+                         instrument=instrument) for tei_file in tei_files]
+
+
+def make_chunks(items: Iterable, chunk_size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def iter_extracted_files(tei_files: Iterable[str], num_workers: int = None, chunk_size: int = 10,
+                         engine: str = 'tree', context_size: int = 1,
+                         context_sizes: List[int] = None, context_chars: List[int] = None,
+                         layout: str = 'flat', validate_tei: bool = False, instrument: bool = False):
+    if num_workers is None:
+        for tei_file in tei_files:
+            print('parsing citation contexts for file', tei_file)
+            yield extract_file(tei_file, engine=engine, context_size=context_size, context_sizes=context_sizes,
+                               context_chars=context_chars, layout=layout, validate_tei=validate_tei,
+                               instrument=instrument)
+        return None
+    # keep a bounded number of chunks in flight and hand back results
+    # in submission order, so the output order matches the serial path
+    max_pending = 2 * num_workers
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for chunk in make_chunks(tei_files, chunk_size):
+            pending.append(executor.submit(extract_citation_rows_chunk, chunk, engine, context_size,
+                                           context_sizes, context_chars, layout, validate_tei,
+                                           instrument))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while len(pending) > 0:
+            yield from pending.popleft().result()
+
+
+def iter_cached_extracted_files(tei_files: Iterable[str], extraction_cache: cache.ExtractionCache,
+                                num_workers: int = None, chunk_size: int = 10, engine: str = 'tree',
+                                validate_tei: bool = False, instrument: bool = False):
+    # cached files are not parsed again, with validate_tei their findings are
+    # read from the cache as well. A cached file that was extracted without
+    # validation has no findings yet and is extracted again.
+    # whether a file is new is decided up front, a file with the same content
+    # as an earlier new file is still extracted itself, so that the extracted
+    # files stay in step with the input files
+    content_hashes = [(tei_file, extraction_cache.get_content_hash(tei_file)) for tei_file in tei_files]
+    is_new = [extraction_cache.has_rows(content_hash) is False
+              or (validate_tei and extraction_cache.has_findings(content_hash) is False)
+              for tei_file, content_hash in content_hashes]
+    new_files = [tei_file for (tei_file, content_hash), new in zip(content_hashes, is_new) if new]
+    print(f'reusing cached citation contexts for {len(content_hashes) - len(new_files)} files, '
+          f'parsing {len(new_files)} new or changed files')
+    # new files come back from the extraction in the same order as they are
+    # submitted, so they can be merged with the cached files in input order
+    extracted = iter_extracted_files(new_files, num_workers=num_workers, chunk_size=chunk_size,
+                                     engine=engine, context_size=extraction_cache.context_size,
+                                     context_sizes=extraction_cache.context_sizes,
+                                     context_chars=extraction_cache.context_chars,
+                                     layout=extraction_cache.layout, validate_tei=validate_tei,
+                                     instrument=instrument)
+    for (tei_file, content_hash), new in zip(content_hashes, is_new):
+        if new is False:
+            findings = extraction_cache.get_findings(content_hash) if validate_tei else None
+            yield tei_file, extraction_cache.get_rows(tei_file, content_hash), None, findings, None
+            continue
+        extracted_file, rows, error, findings, file_metrics = next(extracted)
+        if error is None and content_hash is not None:
+            # the findings go first, the rows file marks the document as done
+            if findings is not None:
+                extraction_cache.put_findings(content_hash, findings)
+            extraction_cache.put_rows(extracted_file, content_hash, rows)
+        yield extracted_file, rows, error, findings, file_metrics
+
+
+def iter_citation_rows(tei_files: Iterable[str], num_workers: int = None, chunk_size: int = 10,
+                       engine: str = 'tree', context_size: int = 1,
+                       context_sizes: List[int] = None, context_chars: List[int] = None,
+                       layout: str = 'flat', extraction_cache: cache.ExtractionCache = None,
+                       finding_sink: sinks.RowSink = None, run_metrics: metrics.RunMetrics = None,
+                       best_version_only: bool = False):
+    # with a finding_sink, each TEI file is validated while it is parsed
+    # for extraction and the findings are written to the sink. With
+    # run_metrics, per file stage timings and counters are collected.
+    # With best_version_only, only the version of each scholar_id with the
+    # most citations is extracted, picked by a scan of the raw files.
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout '{layout}', must be one of {sorted(LAYOUTS)}")
+    validate_tei = finding_sink is not None
+    # options are checked before any file is dispatched, an error raised per
+    # file would only be reported as a parse error of every file
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine '{engine}', must be one of {sorted(ENGINES)}")
+    if engine == 'stream' and validate_tei:
+        raise ValueError("validation needs the parsed tree, use engine 'tree'")
+    instrument = run_metrics is not None
+    # directories and tar, zip or pack archives are expanded to the TEI files in them
+    tei_files = archives.iter_tei_files(tei_files)
+    if best_version_only:
+        tei_files = planner.select_best_versions(tei_files, num_workers=num_workers)
+    if extraction_cache is None:
+        extracted = iter_extracted_files(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                         engine=engine, context_size=context_size,
+                                         context_sizes=context_sizes, context_chars=context_chars,
+                                         layout=layout, validate_tei=validate_tei, instrument=instrument)
+    else:
+        extracted = iter_cached_extracted_files(tei_files, extraction_cache, num_workers=num_workers,
+                                                chunk_size=chunk_size, engine=engine,
+                                                validate_tei=validate_tei, instrument=instrument)
+    try:
+        for tei_file, rows, error, findings, file_metrics in extracted:
+            if error is not None:
+                print('skipping file with parse error', tei_file, error)
+                if validate_tei:
+                    finding_sink.write_row([tei_file, 'parse_error', None, error])
+                if instrument:
+                    run_metrics.add_error(tei_file, error)
+                continue
+            if file_metrics is not None:
+                run_metrics.add_file(file_metrics)
+            elif instrument:
+                run_metrics.add_cached_file(tei_file, len(rows))
+            if findings is not None:
+                finding_sink.write_rows(validate.iter_finding_rows(tei_file, findings))
+            if num_workers is not None:
+                print('parsed citation contexts for file', tei_file)
+            yield from rows
+    finally:
+        # the archives opened for this run are unmapped and closed
+        archives.close_archives()
+
+
+def make_citation_context_csv(tei_files: List[str], citation_context_file: str,
+                              num_workers: int = None, chunk_size: int = 10,
+                              batch_size: int = 10000, engine: str = 'tree',
+                              context_size: int = 1, context_sizes: List[int] = None,
+                              context_chars: List[int] = None, cache_dir: str = None,
+                              validation_file: str = None, metrics_file: str = None,
+                              metrics_log_file: str = None, cited_works_file: str = None,
+                              best_version_only: bool = False):
+    # context_sizes (in sentences) and context_chars (in characters around
+    # the citation) add a context column per window, all made in one pass.
+    # With a validation_file, the validation findings are written to it
+    # during the same parse, or read from the cache for cached files. With a metrics_file and/or metrics_log_file,
+    # stage timings, counters and throughput of the run are recorded. With a
+    # cited_works_file, the deduplicated cited works of the corpus are written to it.
+    # With best_version_only, only one version of each paper is extracted.
+    columns = CITATION_CONTEXT_COLUMNS + get_context_columns(context_sizes, context_chars)
+    sink = sinks.TSVSink(citation_context_file, columns, batch_size=batch_size)
+    finding_sink = None
+    if validation_file is not None:
+        finding_sink = sinks.TSVSink(validation_file, validate.FINDING_COLUMNS, batch_size=batch_size)
+    run_metrics = None
+    if metrics_file is not None or metrics_log_file is not None:
+        run_metrics = metrics.RunMetrics(metrics_file=metrics_file, log_file=metrics_log_file)
+    registry = cited_works.CitedWorkRegistry() if cited_works_file is not None else None
+    try:
+        if cache_dir is None:
+            rows = iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                      engine=engine, context_size=context_size,
+                                      context_sizes=context_sizes, context_chars=context_chars,
+                                      finding_sink=finding_sink, run_metrics=run_metrics,
+                                      best_version_only=best_version_only)
+            if registry is not None:
+                rows = registry.register_rows(rows, columns)
+            return sinks.write_rows(rows, sink)
+        # per document results are stored in cache_dir, a re-run only parses
+        # new or changed files and a crashed run resumes where it stopped
+        with cache.ExtractionCache(cache_dir, EXTRACTOR_VERSION, context_size=context_size,
+                                   context_sizes=context_sizes,
+                                   context_chars=context_chars) as extraction_cache:
+            rows = iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                      engine=engine, extraction_cache=extraction_cache,
+                                      finding_sink=finding_sink, run_metrics=run_metrics,
+                                      best_version_only=best_version_only)
+            if registry is not None:
+                rows = registry.register_rows(rows, columns)
+            return sinks.write_rows(rows, sink)
+    finally:
+        if registry is not None:
+            registry.write_tsv(cited_works_file)
+        if finding_sink is not None:
+            finding_sink.close()
+        if run_metrics is not None:
+            run_metrics.close()
+
 
+def make_citation_context_tables(tei_files: List[str], table_dir: str,
+                                 num_workers: int = None, chunk_size: int = 10,
+                                 batch_size: int = 10000, engine: str = 'tree',
+                                 cache_dir: str = None, best_version_only: bool = False):
+    # write the normalized layout as one TSV file per table in table_dir,
+    # tables.make_flat_citation_contexts turns it back into the flat layout
+    os.makedirs(table_dir, exist_ok=True)
+    table_sinks = {
+        table_name: sinks.TSVSink(os.path.join(table_dir, f'{table_name}.tsv'), columns, batch_size=batch_size)
+        for table_name, columns in CITATION_TABLE_COLUMNS.items()
+    }
+    sink = sinks.TableSink(table_sinks)
+    if cache_dir is None:
+        table_rows = iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                        engine=engine, layout='normalized',
+                                        best_version_only=best_version_only)
+        sinks.write_rows(table_rows, sink)
+        return sink.table_num_rows()
+    with cache.ExtractionCache(cache_dir, EXTRACTOR_VERSION, layout='normalized') as extraction_cache:
+        table_rows = iter_citation_rows(tei_files, num_workers=num_workers, chunk_size=chunk_size,
+                                        engine=engine, extraction_cache=extraction_cache,
+                                        best_version_only=best_version_only)
+        sinks.write_rows(table_rows, sink)
+        return sink.table_num_rows()
@@ -2,12 +2,14 @@ from typing import List, Union
 from xml.etree.ElementTree import Element
 
 import parse_tei
+from records import Reference
 
 
-def get_authors(tei_ele: Element):
-    author_tag = parse_tei.make_tei_tag('author')
+KNOWN_NAME_FIELDS = {'surname', 'forename', 'roleName', 'genName'}
+
+def get_authors(tei_ele: Element, tag_index: parse_tei.TagIndex = None):
     authors = []
-    for author in tei_ele.iter(author_tag):
+    for author in parse_tei.get_elements_by_tag(tei_ele, 'author', tag_index=tag_index):
         author_info = {}
         for child in author:
             tag = parse_tei.clean_tag(child.tag)
@@ -16,7 +18,7 @@ def get_authors(tei_ele: Element):
             else:
                 tag_info = {
                     'text': ' -- '.join([text.strip() for text in child.itertext() if text.strip() != '']),
-                    'attrs': child.attrib
+                    'attrs': dict(child.attrib)
                 }
                 author_info[tag] = tag_info
         authors.append(author_info)
@@ -35,20 +37,22 @@ def get_ref_id(bibl_struct: Element) -> Union[str, None]:
         return None
 
 
-def get_raw_ref(bibl_struct: Element):
-    notes = parse_tei.get_elements_by_tag(bibl_struct, 'note')
+def get_raw_ref(bibl_struct: Element, tag_index: parse_tei.TagIndex = None):
+    notes = parse_tei.get_elements_by_tag(bibl_struct, 'note', tag_index=tag_index)
     for note in notes:
         if 'type' in note.attrib and note.attrib['type'] == 'raw_reference':
             return note.text
     return None
 
 
-def get_ref_info(bibl_struct):
-    analytic = get_analytic(bibl_struct)
-    monogr = get_monogr(bibl_struct)
-    raw_ref = get_raw_ref(bibl_struct)
-    idno = get_ref_idno(bibl_struct)
-    ref_ids = get_ref_idno(bibl_struct)
+def get_ref_info(bibl_struct, tag_index: parse_tei.TagIndex = None):
+    if tag_index is None or bibl_struct not in tag_index:
+        tag_index = parse_tei.TagIndex(bibl_struct)
+    analytic = get_analytic(bibl_struct, tag_index=tag_index)
+    monogr = get_monogr(bibl_struct, tag_index=tag_index)
+    raw_ref = get_raw_ref(bibl_struct, tag_index=tag_index)
+    idno = get_ref_idno(bibl_struct, tag_index=tag_index)
+    ref_ids = idno
     doi = get_doi(ref_ids)
     if doi:
         pub_id = doi
@@ -74,8 +78,8 @@ def get_doi(ref_ids: List[dict]):
         return None
 
 
-def get_title(tei_ele: Element):
-    tei_title = parse_tei.get_element_by_tag(tei_ele, 'title')
+def get_title(tei_ele: Element, tag_index: parse_tei.TagIndex = None):
+    tei_title = parse_tei.get_element_by_tag(tei_ele, 'title', tag_index=tag_index)
     if tei_title is not None:
         title = ' ---- '.join([text_string for text_string in tei_title.itertext()])
     else:
@@ -83,59 +87,59 @@ def get_title(tei_ele: Element):
     return title
 
 
-def get_analytic(bibl_struct: Element):
-    analytic = parse_tei.get_element_by_tag(bibl_struct, 'analytic')
+def get_analytic(bibl_struct: Element, tag_index: parse_tei.TagIndex = None):
+    analytic = parse_tei.get_element_by_tag(bibl_struct, 'analytic', tag_index=tag_index)
     if analytic is None:
         return None
-    analytic_title = parse_tei.get_element_by_tag(analytic, 'title')
+    analytic_title = parse_tei.get_element_by_tag(analytic, 'title', tag_index=tag_index)
     if analytic_title is not None:
         title = ' ---- '.join([text_string for text_string in analytic_title.itertext()])
     else:
         title = None
-    ref_ids = get_ref_idno(analytic)
+    ref_ids = get_ref_idno(analytic, tag_index=tag_index)
     analytic_info = {
         'id': get_ref_id(bibl_struct),
         'title': title,
-        'authors': get_authors(analytic),
+        'authors': get_authors(analytic, tag_index=tag_index),
         'ref_ids': ref_ids,
         'doi': get_doi(ref_ids)
     }
     return analytic_info
 
 
-def get_monogr(bibl_struct: Element):
-    monogr = parse_tei.get_elements_by_tag(bibl_struct, 'monogr')[0]
-    monogr_info = {'authors': get_authors(monogr)}
+def get_monogr(bibl_struct: Element, tag_index: parse_tei.TagIndex = None):
+    monogr = parse_tei.get_elements_by_tag(bibl_struct, 'monogr', tag_index=tag_index)[0]
+    monogr_info = {'authors': get_authors(monogr, tag_index=tag_index)}
     for child in monogr:
         if parse_tei.has_tag(child, 'author'):
             continue
         if parse_tei.has_tag(child, 'imprint'):
-            monogr_info['imprint'] = get_imprint(child)
+            monogr_info['imprint'] = get_imprint(child, tag_index=tag_index)
         else:
             tag = parse_tei.clean_tag(child.tag)
             tag_info = {
                 'text': ' '.join([text for text in child.itertext()]),
-                'attrs': child.attrib
+                'attrs': dict(child.attrib)
             }
             monogr_info[tag] = tag_info
     return monogr_info
 
 
-def get_imprint(bibl_struct: Element):
-    imprint = parse_tei.get_elements_by_tag(bibl_struct, 'imprint')[0]
+def get_imprint(bibl_struct: Element, tag_index: parse_tei.TagIndex = None):
+    imprint = parse_tei.get_elements_by_tag(bibl_struct, 'imprint', tag_index=tag_index)[0]
     imprint_info = {}
     for child in imprint:
         tag = parse_tei.clean_tag(child.tag)
         tag_info = {
             'text': ' '.join([text for text in child.itertext()]),
-            'attrs': child.attrib
+            'attrs': dict(child.attrib)
         }
         imprint_info[tag] = tag_info
     return imprint_info
 
 
-def get_ref_idno(analytic: Element) -> Union[List[dict], None]:
-    idno_list = parse_tei.get_elements_by_tag(analytic, 'idno')
+def get_ref_idno(analytic: Element, tag_index: parse_tei.TagIndex = None) -> Union[List[dict], None]:
+    idno_list = parse_tei.get_elements_by_tag(analytic, 'idno', tag_index=tag_index)
     if len(idno_list) == 0:
         return None
     else:
@@ -147,11 +151,13 @@ def get_ref_idno(analytic: Element) -> Union[List[dict], None]:
 
 
 def parse_ref_author_name(author):
-    name_dict = author['author_name']
+    return format_author_name(author['author_name'])
+
+
+def format_author_name(name_dict: dict) -> str:
     author_name = ''
-    known_fields = {'surname', 'forename', 'roleName', 'genName'}
     for field in name_dict:
-        if field not in known_fields:
+        if field not in KNOWN_NAME_FIELDS:
             print(name_dict)
     if 'surname' in name_dict and 'forename' in name_dict:
         author_name = f"{name_dict['forename']} {name_dict['surname']}"
@@ -160,8 +166,22 @@ def parse_ref_author_name(author):
     return author_name
 
 
-def get_ref_cited_info(ref: dict):
-    assert isinstance(ref, dict), "ref must be a dictionary"
+def get_reference_cited_info(ref: Reference):
+    # same as get_ref_cited_info, read from the record fields
+    cited_title, cited_author = None, None
+    if ref.analytic is not None and ref.analytic.title is not None:
+        cited_title = ref.analytic.title
+    elif 'title' in ref.monogr.fields:
+        cited_title = ref.monogr.fields['title'].text
+    authors = ref.analytic.authors if ref.analytic is not None else ref.monogr.authors
+    cited_author = ', '.join([format_author_name(aut.name) for aut in authors if aut.name is not None])
+    return ref.id, cited_title, cited_author, ref.raw_ref
+
+
+def get_ref_cited_info(ref: Union[Reference, dict]):
+    if isinstance(ref, Reference):
+        return get_reference_cited_info(ref)
+    assert isinstance(ref, dict), "ref must be a dictionary or a Reference"
     cited_title, cited_author, cited_raw = None, None, None
     if 'analytic' in ref and ref['analytic'] and 'title' in ref['analytic'] and ref['analytic']['title'] is not None:
         cited_title = ref['analytic']['title']
@@ -179,3 +199,12 @@ def get_ref_cited_info(ref: dict):
         print('no id in ref:', ref)
     return ref['id'], cited_title, cited_author, cited_raw
 
+
+def get_publication_metadata(tei_header: Element, tag_index: parse_tei.TagIndex = None):
+    if tag_index is None or tei_header not in tag_index:
+        tag_index = parse_tei.TagIndex(tei_header)
+    bibl_struct = parse_tei.get_element_by_tag(tei_header, 'biblStruct', tag_index=tag_index)
+    publication_metadata = get_ref_info(bibl_struct, tag_index=tag_index)
+    title_stmt = parse_tei.get_element_by_tag(tei_header, 'titleStmt', tag_index=tag_index)
+    publication_metadata['title'] = ' <> '.join([text.strip() for text in title_stmt.itertext() if text.strip() != ''])
+    return publication_metadata
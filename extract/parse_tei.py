@@ -1,7 +1,11 @@
-import xml.etree.ElementTree as ElementTree
-from typing import Union
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Union
 from xml.etree.ElementTree import Element
 
+import archives
+import xml_backend
+
 
 ns = {
     'tei': 'http://www.tei-c.org/ns/1.0',
@@ -24,42 +28,101 @@ def get_name_space(tag: str):
     return tag_name_space
 
 
+# lookup tables for namespaced and clean tags, filled as tags are encountered
+TEI_TAGS: Dict[str, str] = {}
+CLEAN_TAGS: Dict[str, str] = {}
+
+
 def has_tag(ele: Element, tag: str):
-    tag_name_space = get_name_space(tag)
-    return ele.tag == "{" + tag_name_space + "}" + tag
+    return ele.tag == make_tei_tag(tag)
 
 
 def has_section_head(div: Element):
-    child_tags = [clean_tag(child.tag) for child in div]
-    return len(child_tags) > 0 and child_tags[0] == 'head'
+    for child in div:
+        return clean_tag(child.tag) == 'head'
+    return False
 
 
 def make_tei_tag(tag: str):
-    tag_name_space = get_name_space(tag)
-    return "{" + tag_name_space + "}" + tag
-
-
-def clean_tag(tag:str):
-    for label in ns:
-        if ns[label] in tag:
-            tag = tag.replace('{' + ns[label] + '}', '')
-    return tag
+    if tag not in TEI_TAGS:
+        tag_name_space = get_name_space(tag)
+        TEI_TAGS[tag] = "{" + tag_name_space + "}" + tag
+    return TEI_TAGS[tag]
+
+
+def clean_tag(tag: str):
+    if tag not in CLEAN_TAGS:
+        clean = tag
+        for label in ns:
+            if ns[label] in clean:
+                clean = clean.replace('{' + ns[label] + '}', '')
+        CLEAN_TAGS[tag] = clean
+    return CLEAN_TAGS[tag]
+
+
+class TagIndex:
+
+    def __init__(self, root: Element):
+        # a single walk over the document records the position of each element
+        # in document order and where its subtree ends, so the descendants
+        # with a given tag are a contiguous slice of that tag's element list
+        self.root = root
+        self.position = {}
+        self.end = {}
+        self.tag_positions = defaultdict(list)
+        self.tag_elements = defaultdict(list)
+        elements = list(xml_backend.iter_elements(root))
+        for pos, ele in enumerate(elements):
+            self.position[ele] = pos
+            self.tag_positions[ele.tag].append(pos)
+            self.tag_elements[ele.tag].append(ele)
+        for pos in range(len(elements) - 1, -1, -1):
+            ele = elements[pos]
+            if len(ele) == 0:
+                self.end[ele] = pos + 1
+            else:
+                self.end[ele] = self.end[ele[-1]]
+
+    def __contains__(self, ele: Element):
+        return ele in self.position
+
+    def get_elements(self, ele: Element, tag: str) -> List[Element]:
+        positions = self.tag_positions.get(tag)
+        if positions is None:
+            return []
+        start = bisect_left(positions, self.position[ele])
+        end = bisect_left(positions, self.end[ele], lo=start)
+        return self.tag_elements[tag][start:end]
+
+    def get_element(self, ele: Element, tag: str) -> Union[Element, None]:
+        positions = self.tag_positions.get(tag)
+        if positions is None:
+            return None
+        start = bisect_left(positions, self.position[ele])
+        if start < len(positions) and positions[start] < self.end[ele]:
+            return self.tag_elements[tag][start]
+        return None
 
 
-def get_elements_by_tag(ele: Element, tag: str):
+def get_elements_by_tag(ele: Element, tag: str, tag_index: TagIndex = None):
     if ns['tei'] not in tag:
         tag = make_tei_tag(tag)
+    if tag_index is not None and ele in tag_index:
+        return tag_index.get_elements(ele, tag)
     eles = []
     for child in ele.iter(tag):
         eles.append(child)
     return eles
 
 
-def get_element_by_tag(ele: Element, tag: str):
-    elements = get_elements_by_tag(ele, tag)
-    if len(elements) == 0:
-        return None
-    return elements[0]
+def get_element_by_tag(ele: Element, tag: str, tag_index: TagIndex = None):
+    if ns['tei'] not in tag:
+        tag = make_tei_tag(tag)
+    if tag_index is not None and ele in tag_index:
+        return tag_index.get_element(ele, tag)
+    for child in ele.iter(tag):
+        return child
+    return None
 
 
 def make_bibl_string(bibl_struct: Element):
@@ -68,8 +131,8 @@ def make_bibl_string(bibl_struct: Element):
 
 
 def parse_tei_file(tei_file: str):
-    tree = ElementTree.parse(tei_file)
-    root = tree.getroot()
+    # tei_file can also be a TEI file in an archive or a gzipped TEI file
+    root = xml_backend.parse(archives.open_tei(tei_file))
     tei_header = root.find('tei:teiHeader', ns)
     tei_text = root.find('tei:text', ns)
     return tei_header, tei_text
@@ -0,0 +1,133 @@
+from typing import Dict, List, Tuple
+
+import archives
+import parse_tei
+import parse_bibl_data as parse_bib
+import parse_text
+import records
+import xml_backend
+
+
+TEI_HEADER_TAG = parse_tei.make_tei_tag('teiHeader')
+TEXT_TAG = parse_tei.make_tei_tag('text')
+BODY_TAG = parse_tei.make_tei_tag('body')
+DIV_TAG = parse_tei.make_tei_tag('div')
+HEAD_TAG = parse_tei.make_tei_tag('head')
+PARA_TAG = parse_tei.make_tei_tag('p')
+LIST_BIBL_TAG = parse_tei.make_tei_tag('listBibl')
+BIBL_STRUCT_TAG = parse_tei.make_tei_tag('biblStruct')
+ID_TAG = parse_tei.make_tei_tag('id')
+
+
+class StreamState:
+
+    def __init__(self):
+        self.stack = []
+        # one entry per open div in body: the section dict if the div has a head, else None
+        self.div_sections = []
+        # number of children seen so far for each open div
+        self.div_child_count = []
+        self.section_heads = {}
+        self.section_path = ()
+        self.in_text = False
+        self.in_body = False
+        self.body_seen = False
+        self.list_bibl_depth = None
+        self.list_bibl_seen = False
+
+
+def iter_tei_events(tei_file: str):
+    # Walk the TEI file once and emit (event_type, data) tuples, with event_type
+    # one of 'header', 'section', 'paragraph' or 'reference'. Parsed subtrees
+    # are removed from the tree straight away.
+    state = StreamState()
+    for event, ele in xml_backend.iterparse(archives.open_tei(tei_file), events=('start', 'end')):
+        if event == 'start':
+            handle_start(state, ele)
+            state.stack.append(ele)
+        else:
+            state.stack.pop()
+            yield from handle_end(state, ele)
+
+
+def handle_start(state: StreamState, ele):
+    if ele.tag == TEXT_TAG and len(state.stack) == 1:
+        state.in_text = True
+    elif state.in_text is False:
+        return None
+    if state.in_body and len(state.div_sections) > 0 and state.stack[-1].tag == DIV_TAG:
+        # has_section_head only looks at the first child of a div
+        state.div_child_count[-1] += 1
+        if state.div_child_count[-1] == 1 and ele.tag == HEAD_TAG:
+            section = {'title': None, 'number': None, 'level': None, 'paragraphs': []}
+            state.div_sections[-1] = section
+            state.section_heads[id(ele)] = section
+    if ele.tag == BODY_TAG and state.body_seen is False:
+        state.in_body = True
+        state.body_seen = True
+    elif ele.tag == DIV_TAG and state.in_body:
+        state.div_sections.append(None)
+        state.div_child_count.append(0)
+    elif ele.tag == LIST_BIBL_TAG and state.list_bibl_seen is False:
+        state.list_bibl_depth = len(state.stack)
+        state.list_bibl_seen = True
+
+
+def handle_end(state: StreamState, ele):
+    if ele.tag == TEI_HEADER_TAG:
+        yield 'header', parse_bib.get_publication_metadata(ele)
+        release(state, ele)
+    if state.in_text is False:
+        return None
+    if ele.tag == HEAD_TAG and id(ele) in state.section_heads:
+        section = state.section_heads.pop(id(ele))
+        section.update(parse_text.get_head_info(ele))
+        state.section_path = parse_text.resolve_section_path(state.section_path, section)
+        section['section_path'] = state.section_path
+        # paragraphs are added to the section as they are parsed
+        yield 'section', section
+    elif ele.tag == PARA_TAG and state.in_body:
+        sections = [section for section in state.div_sections if section is not None]
+        if len(sections) > 0:
+            # like parse_sections, a paragraph belongs to the nearest div with a head
+            paragraph = parse_text.parse_paragraph(ele, len(sections[-1]['paragraphs']))
+            sections[-1]['paragraphs'].append(paragraph)
+            yield 'paragraph', paragraph
+        release(state, ele)
+    elif ele.tag == DIV_TAG and state.in_body:
+        state.div_sections.pop()
+        state.div_child_count.pop()
+        release(state, ele)
+    elif ele.tag == BODY_TAG and state.in_body:
+        state.in_body = False
+        release(state, ele)
+    elif ele.tag == BIBL_STRUCT_TAG and state.list_bibl_depth is not None:
+        ref = parse_bib.get_ref_info(ele)
+        ref['bid_id'] = ele.attrib[ID_TAG]
+        yield 'reference', records.Reference.from_dict(ref)
+        release(state, ele)
+    elif ele.tag == LIST_BIBL_TAG and state.list_bibl_depth == len(state.stack):
+        state.list_bibl_depth = None
+        release(state, ele)
+
+
+def release(state: StreamState, ele):
+    ele.clear()
+    if len(state.stack) > 0:
+        state.stack[-1].remove(ele)
+
+
+def parse_tei_stream(tei_file: str) -> Tuple[dict, List[dict], Dict[str, records.Reference]]:
+    # single pass alternative to parse_tei_file, get_publication_metadata,
+    # parse_sections and get_references, returning the same structures
+    publication_metadata = None
+    sections = []
+    references = {}
+    for event_type, data in iter_tei_events(tei_file):
+        if event_type == 'header':
+            publication_metadata = data
+        elif event_type == 'section':
+            sections.append(data)
+        elif event_type == 'reference':
+            references[data.bid_id] = data
+    return publication_metadata, sections, references
@@ -2,18 +2,46 @@ import re
 from xml.etree.ElementTree import Element
 
 import parse_tei
+from records import Citation, Sentence
 
 
-def get_section_divs(text_ele: Element):
-    body = parse_tei.get_element_by_tag(text_ele, 'body')
-    divs = parse_tei.get_elements_by_tag(body, 'div')
-    return [div for div in divs if parse_tei.has_section_head(div) is True]
+DIV_TAG = parse_tei.make_tei_tag('div')
+PARA_TAG = parse_tei.make_tei_tag('p')
 
+# leading section numbers like '2.1 ', '3. ' or 'IV. '
+SECTION_NUMBER_PATTERN = re.compile(r'^(?:[0-9]+(?:\.[0-9]+)*|[ivxlc]+)\.?\s+')
 
-def get_section_title_info(div: Element):
-    if parse_tei.has_section_head(div) is False:
-        return None
-    head_ele = parse_tei.get_element_by_tag(div, 'head')
+# between the titles of a section path in the section_title column
+SECTION_PATH_SEPARATOR = ' -- '
+
+
+def normalize_section_title(section_title) -> str:
+    # '2.1 Related Work' and 'RELATED WORK' are the same section, citations
+    # without a section title are in the section ''
+    if isinstance(section_title, str) is False:
+        return ''
+    section_title = ' '.join(section_title.lower().split())
+    return SECTION_NUMBER_PATTERN.sub('', section_title)
+
+
+def normalize_section_path(section_title) -> str:
+    # each title of a joined section path normalized on its own,
+    # '2 Related Work -- 2.1 User Studies' becomes 'related work -- user studies'
+    if isinstance(section_title, str) is False:
+        return ''
+    return SECTION_PATH_SEPARATOR.join(normalize_section_title(title)
+                                       for title in section_title.split(SECTION_PATH_SEPARATOR))
+
+
+def normalize_top_section_title(section_title) -> str:
+    # the normalized title of the top-level section of a joined section path,
+    # '2 Related Work -- 2.1 User Studies' becomes 'related work'
+    if isinstance(section_title, str) is False:
+        return ''
+    return normalize_section_title(section_title.split(SECTION_PATH_SEPARATOR, 1)[0])
+
+
+def get_head_info(head_ele: Element):
     section_title = {
         'title': ' '.join([text for text in head_ele.itertext()]),
         'number': None,
@@ -26,28 +54,39 @@ def get_section_title_info(div: Element):
     return section_title
 
 
-def parse_sections(text_ele: Element):
-    section_divs = get_section_divs(text_ele)
-    sections = []
-    for section_div in section_divs:
-        section = parse_section(section_div)
-        sections.append(section)
-    return sections
-
+def resolve_section_path(section_path: tuple, section: dict):
+    # the numbering level of a section determines where it goes in the path
+    # of titles, sections without a numbered head leave the path as it is
+    if section['level'] is None:
+        return section_path
+    return section_path[:section['level'] - 1] + (section['title'],)
 
-def parse_section(section_div: Element):
-    section = get_section_title_info(section_div)
-    section['paragraphs'] = parse_paragraphs(section_div)
-    return section
 
-
-def parse_paragraphs(text_ele: Element):
-    para_tag = parse_tei.make_tei_tag('p')
-    paragraphs = []
-    for pi, para_ele in enumerate(text_ele.iter(para_tag)):
-        paragraph = parse_paragraph(para_ele, pi)
-        paragraphs.append(paragraph)
-    return paragraphs
+def parse_sections(text_ele: Element, tag_index: parse_tei.TagIndex = None):
+    # builds the sections in a single walk over the body in document order.
+    # Each paragraph is parsed once and belongs to the nearest div with a head,
+    # so paragraphs of nested sections are not repeated in their ancestors.
+    body = parse_tei.get_element_by_tag(text_ele, 'body', tag_index=tag_index)
+    sections = []
+    if body is None:
+        return sections
+    section_path = ()
+    stack = [(body, None)]
+    while len(stack) > 0:
+        ele, section = stack.pop()
+        if ele.tag == PARA_TAG:
+            if section is not None:
+                section['paragraphs'].append(parse_paragraph(ele, len(section['paragraphs'])))
+            continue
+        if ele.tag == DIV_TAG and len(ele) > 0 and parse_tei.has_tag(ele[0], 'head'):
+            section = get_head_info(ele[0])
+            section['paragraphs'] = []
+            # the path tuple is shared by reference by all rows of the section
+            section_path = resolve_section_path(section_path, section)
+            section['section_path'] = section_path
+            sections.append(section)
+        stack.extend([(child, section) for child in reversed(ele)])
+    return sections
 
 
 def parse_paragraph(para_ele: Element, para_index: int):
@@ -68,48 +107,42 @@ def get_text_references(text_ele: Element, ref_type: str = None):
     return reference_elements
 
 
-def parse_sentence(sent_ele: Element, sent_index: int):
-    sentence = {
-        'sentence_index': sent_index,
-        'text': '',
-        'text_strings': [sent_ele.text] if sent_ele.text else [],
-        'citations': []
-    }
+def parse_sentence(sent_ele: Element, sent_index: int) -> Sentence:
+    # the text strings are only kept until the sentence text is joined,
+    # Sentence.to_dict gives them back for the old dict shape
+    sentence = Sentence(sent_index)
+    text_strings = [sent_ele.text] if sent_ele.text else []
+    # keep a running length of the text so far instead of re-summing
+    # all text strings for every citation
+    text_length = len(sent_ele.text) if sent_ele.text else 0
     citation_elements = get_text_references(sent_ele, ref_type='bibr')
     for ci, citation_ele in enumerate(citation_elements):
-        text_length = sum([len(text_string) for text_string in sentence['text_strings']])
         citation = parse_citation(citation_ele, ci, text_length)
-        if citation['text'] is None:
+        if citation.text is None:
             # an empty reference element, e.g.
             # "<ref type="bibr"></ref>" in 5cGJUhg2MBsJ.1.grobid.tei.xml
+            sentence.empty_citations += 1
             continue
             # print('citation has no text:', citation, [text for text in citation_ele.itertext()])
-            # print(sentence['citations'])
+            # print(sentence.citations)
             # print(sentence)
-        sentence['citations'].append(citation)
-        sentence['text_strings'].append(citation['text'])
+        sentence.citations.append(citation)
+        text_strings.append(citation.text)
+        text_length += len(citation.text)
         if citation_ele.tail:
-            sentence['text_strings'].append(citation_ele.tail)
-    sentence['text'] = ''.join(sentence['text_strings'])
-    for citation in sentence['citations']:
-        if citation['text'] is None:
-            print("citation['text'] is None, citation:", citation)
-            print("sentence:", sentence)
-        assert sentence['text'][citation['char_index']:].startswith(citation['text'])
+            text_strings.append(citation_ele.tail)
+            text_length += len(citation_ele.tail)
+    sentence.text = ''.join(text_strings)
+    for citation in sentence.citations:
+        assert sentence.text[citation.char_index:].startswith(citation.text)
     return sentence
 
 
-def parse_citation(citation_ele: Element, citation_index: int, text_length: int):
+def parse_citation(citation_ele: Element, citation_index: int, text_length: int) -> Citation:
     # if 'target' not in citation_ele.attrib:
     #     print('no reference:', [text for text in citation_ele.itertext()], citation_ele.attrib)
     ref_id = citation_ele.attrib['target'][1:] if 'target' in citation_ele.attrib else None
-    citation = {
-        'citation_index': citation_index,
-        'reference_id': ref_id,
-        'char_index': text_length,
-        'text': citation_ele.text
-    }
-    return citation
+    return Citation(citation_index, ref_id, text_length, citation_ele.text)
 
 
 def parse_footnotes(text_ele: Element):
@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Tuple, Union
+
+import archives
+
+
+PLAN_COLUMNS = ['doc_id', 'scholar_id', 'version', 'num_bibr_refs', 'num_bibl_structs', 'selected', 'error']
+
+# byte patterns counted in the raw TEI, GROBID writes the citations in the
+# text as <ref type="bibr" target="#b0"> and each reference as a <biblStruct>
+BIBR_REF_PATTERN = b'type="bibr"'
+BIBL_STRUCT_PATTERN = b'<biblStruct'
+
+
+def parse_doc_id(doc_id: str) -> Tuple[str, Union[str, None]]:
+    # TEI files are named <scholar_id>.<version>.grobid.tei.xml
+    fdir, fname = os.path.split(doc_id)
+    scholar_id, *rest = fname.split('.')
+    version = rest[0] if len(rest) > 0 else None
+    return scholar_id, version
+
+
+def count_tei_markers(tei_file: str):
+    # runs in a worker process. Counting the bytes is much cheaper than
+    # parsing, and the number of bibr refs follows the number of citation
+    # contexts the file will give.
+    try:
+        tei_data = archives.read_tei_bytes(tei_file)
+        return tei_file, tei_data.count(BIBR_REF_PATTERN), tei_data.count(BIBL_STRUCT_PATTERN), None
+    except (OSError, KeyError) as err:
+        return tei_file, None, None, f"{err.__class__.__name__}: {err}"
+
+
+def iter_counted_files(tei_files: Iterable[str], num_workers: int = None, chunk_size: int = 100):
+    if num_workers is None:
+        for tei_file in tei_files:
+            yield count_tei_markers(tei_file)
+        return None
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        yield from executor.map(count_tei_markers, tei_files, chunksize=chunk_size)
+
+
+def get_version_score(plan_row: list):
+    # most citations first, then most references. A file that could not be
+    # read scores lowest, but is still picked if it is the only version, so
+    # that the extraction reports the error.
+    num_bibr_refs, num_bibl_structs = plan_row[3], plan_row[4]
+    if num_bibr_refs is None:
+        return -1, -1
+    return num_bibr_refs, num_bibl_structs
+
+
+def plan_corpus(tei_files: Iterable[str], num_workers: int = None, chunk_size: int = 100) -> List[list]:
+    # One row per TEI file, with PLAN_COLUMNS, in input order. Of the
+    # versions of a scholar_id, the one with the highest score is selected,
+    # on a tie the first in input order, like the idxmax of a groupby.
+    plan = []
+    best = {}
+    for tei_file, num_bibr_refs, num_bibl_structs, error in iter_counted_files(
+            archives.iter_tei_files(tei_files), num_workers=num_workers, chunk_size=chunk_size):
+        scholar_id, version = parse_doc_id(tei_file)
+        plan_row = [tei_file, scholar_id, version, num_bibr_refs, num_bibl_structs, False, error]
+        if scholar_id not in best or get_version_score(plan_row) > get_version_score(best[scholar_id]):
+            best[scholar_id] = plan_row
+        plan.append(plan_row)
+    for plan_row in best.values():
+        plan_row[5] = True
+    return plan
+
+
+def select_best_versions(tei_files: Iterable[str], num_workers: int = None,
+                         chunk_size: int = 100) -> List[str]:
+    plan = plan_corpus(tei_files, num_workers=num_workers, chunk_size=chunk_size)
+    num_selected = sum(1 for plan_row in plan if plan_row[5])
+    print(f'selected the best version of {num_selected} papers, skipping {len(plan) - num_selected} '
+          f'other versions')
+    return [plan_row[0] for plan_row in plan if plan_row[5]]
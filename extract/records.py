@@ -0,0 +1,189 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Union
+
+
+# Compact records for the parsed references and sentences. They hold plain
+# values only, no elements or attrib dicts of the XML tree, so the tree can be
+# released as soon as a document is parsed. Each record has a to_dict method
+# that returns the dict shape the parsing functions used to return.
+
+
+@dataclass(slots=True)
+class Field:
+    text: str
+    attrs: Dict[str, str]
+
+    @classmethod
+    def from_dict(cls, tag_info: dict):
+        return cls(tag_info['text'], dict(tag_info['attrs']))
+
+    def to_dict(self):
+        return {'text': self.text, 'attrs': dict(self.attrs)}
+
+
+def fields_from_dict(info: dict, skip: set) -> Dict[str, Field]:
+    return {tag: Field.from_dict(tag_info) for tag, tag_info in info.items() if tag not in skip}
+
+
+def fields_to_dict(fields: Dict[str, Field]) -> dict:
+    return {tag: tag_field.to_dict() for tag, tag_field in fields.items()}
+
+
+def idnos_from_list(idno_list: Union[List[dict], None]):
+    if idno_list is None:
+        return None
+    return tuple((idno['type'], idno['value']) for idno in idno_list)
+
+
+def idnos_to_list(idnos: Union[Tuple[Tuple[str, str], ...], None]):
+    if idnos is None:
+        return None
+    return [{'type': idno_type, 'value': value} for idno_type, value in idnos]
+
+
+@dataclass(slots=True)
+class Author:
+    name: Union[Dict[str, str], None]
+    fields: Dict[str, Field]
+
+    @classmethod
+    def from_dict(cls, author_info: dict):
+        name = dict(author_info['author_name']) if 'author_name' in author_info else None
+        return cls(name, fields_from_dict(author_info, skip={'author_name'}))
+
+    def to_dict(self):
+        author_info = fields_to_dict(self.fields)
+        if self.name is not None:
+            author_info['author_name'] = dict(self.name)
+        return author_info
+
+
+@dataclass(slots=True)
+class Analytic:
+    id: Union[str, None]
+    title: Union[str, None]
+    authors: Tuple[Author, ...]
+    ref_ids: Union[Tuple[Tuple[str, str], ...], None]
+    doi: Union[str, None]
+
+    @classmethod
+    def from_dict(cls, analytic_info: dict):
+        authors = tuple(Author.from_dict(author) for author in analytic_info['authors'])
+        return cls(analytic_info['id'], analytic_info['title'], authors,
+                   idnos_from_list(analytic_info['ref_ids']), analytic_info['doi'])
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'authors': [author.to_dict() for author in self.authors],
+            'ref_ids': idnos_to_list(self.ref_ids),
+            'doi': self.doi
+        }
+
+
+@dataclass(slots=True)
+class Monogr:
+    authors: Tuple[Author, ...]
+    fields: Dict[str, Field]
+    imprint: Union[Dict[str, Field], None] = None
+
+    @classmethod
+    def from_dict(cls, monogr_info: dict):
+        authors = tuple(Author.from_dict(author) for author in monogr_info['authors'])
+        imprint = None
+        if 'imprint' in monogr_info:
+            imprint = fields_from_dict(monogr_info['imprint'], skip=set())
+        return cls(authors, fields_from_dict(monogr_info, skip={'authors', 'imprint'}), imprint)
+
+    def to_dict(self):
+        monogr_info = {'authors': [author.to_dict() for author in self.authors]}
+        monogr_info.update(fields_to_dict(self.fields))
+        if self.imprint is not None:
+            monogr_info['imprint'] = fields_to_dict(self.imprint)
+        return monogr_info
+
+
+@dataclass(slots=True)
+class Reference:
+    bid_id: Union[str, None]
+    id: Union[str, None]
+    doi: Union[str, None]
+    idno: Union[Tuple[Tuple[str, str], ...], None]
+    raw_ref: Union[str, None]
+    analytic: Union[Analytic, None]
+    monogr: Monogr
+
+    @classmethod
+    def from_dict(cls, ref: dict):
+        analytic = Analytic.from_dict(ref['analytic']) if ref['analytic'] is not None else None
+        return cls(ref.get('bid_id'), ref['id'], ref['doi'], idnos_from_list(ref['idno']),
+                   ref['raw_ref'], analytic, Monogr.from_dict(ref['monogr']))
+
+    def to_dict(self):
+        ref = {
+            'analytic': self.analytic.to_dict() if self.analytic is not None else None,
+            'monogr': self.monogr.to_dict(),
+            'raw_ref': self.raw_ref,
+            'idno': idnos_to_list(self.idno),
+            'doi': self.doi,
+            'id': self.id
+        }
+        if self.bid_id is not None:
+            ref['bid_id'] = self.bid_id
+        return ref
+
+
+@dataclass(slots=True)
+class Citation:
+    citation_index: int
+    reference_id: Union[str, None]
+    char_index: int
+    text: str
+
+    def to_dict(self):
+        return {
+            'citation_index': self.citation_index,
+            'reference_id': self.reference_id,
+            'char_index': self.char_index,
+            'text': self.text
+        }
+
+
+@dataclass(slots=True)
+class Sentence:
+    sentence_index: int
+    text: str = ''
+    citations: List[Citation] = field(default_factory=list)
+    empty_citations: int = 0
+
+    def get_text_strings(self) -> List[str]:
+        # the text split at the citation boundaries, which is how the
+        # sentence text was put together from the element text and tails
+        text_strings = []
+        offset = 0
+        for citation in self.citations:
+            if citation.char_index > offset:
+                text_strings.append(self.text[offset:citation.char_index])
+            text_strings.append(citation.text)
+            offset = citation.char_index + len(citation.text)
+        if offset < len(self.text):
+            text_strings.append(self.text[offset:])
+        return text_strings
+
+    def to_dict(self):
+        return {
+            'sentence_index': self.sentence_index,
+            'text': self.text,
+            'text_strings': self.get_text_strings(),
+            'citations': [citation.to_dict() for citation in self.citations],
+            'empty_citations': self.empty_citations
+        }
+
+
+def paragraph_to_dict(paragraph: dict):
+    return {**paragraph, 'sentences': [sent.to_dict() for sent in paragraph['sentences']]}
+
+
+def section_to_dict(section: dict):
+    return {**section, 'paragraphs': [paragraph_to_dict(para) for para in section['paragraphs']]}
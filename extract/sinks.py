@@ -0,0 +1,93 @@
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+
+class RowSink:
+
+    def __init__(self, columns: List[str], batch_size: int = 10000):
+        self.columns = columns
+        self.batch_size = batch_size
+        self.batch = []
+        self.num_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_row(self, row: list):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def write_rows(self, rows: Iterable[list]):
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self):
+        if len(self.batch) == 0:
+            return None
+        self.write_batch(self.batch)
+        self.num_rows += len(self.batch)
+        self.batch = []
+
+    def write_batch(self, batch: List[list]):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class TSVSink(RowSink):
+
+    def __init__(self, output_file: str, columns: List[str], batch_size: int = 10000):
+        super().__init__(columns=columns, batch_size=batch_size)
+        self.output_file = output_file
+        # same encoding and line endings as DataFrame.to_csv with a file path,
+        # whatever the locale
+        self.fh = open(output_file, 'w', encoding='utf-8', newline='')
+        self.has_header = False
+
+    def write_batch(self, batch: List[list]):
+        df = pd.DataFrame(batch, columns=self.columns)
+        df.to_csv(self.fh, sep='\t', index=False, header=not self.has_header)
+        self.fh.flush()
+        self.has_header = True
+
+    def close(self):
+        if self.fh.closed:
+            return None
+        self.flush()
+        if self.has_header is False:
+            # no rows at all, still write the header like an empty DataFrame would
+            pd.DataFrame([], columns=self.columns).to_csv(self.fh, sep='\t', index=False)
+        self.fh.close()
+
+
+class TableSink(RowSink):
+
+    def __init__(self, table_sinks: Dict[str, RowSink]):
+        # rows come in as [table_name, row] pairs and are handed to the sink
+        # for that table, which does its own batching
+        super().__init__(columns=['table_name', 'row'], batch_size=1)
+        self.table_sinks = table_sinks
+
+    def write_row(self, row: list):
+        table_name, table_row = row
+        self.table_sinks[table_name].write_row(table_row)
+        self.num_rows += 1
+
+    def table_num_rows(self) -> Dict[str, int]:
+        return {table_name: sink.num_rows for table_name, sink in self.table_sinks.items()}
+
+    def close(self):
+        for sink in self.table_sinks.values():
+            sink.close()
+
+
+def write_rows(rows: Iterable[list], sink: RowSink):
+    with sink:
+        sink.write_rows(rows)
+    return sink.num_rows
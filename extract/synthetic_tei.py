@@ -0,0 +1,146 @@
+import os
+import random
+import xml.etree.ElementTree as ElementTree
+from typing import List
+from xml.etree.ElementTree import Element, SubElement
+
+import parse_tei
+
+
+ElementTree.register_namespace('', parse_tei.ns['tei'])
+
+WORDS = [
+    'search', 'users', 'information', 'retrieval', 'study', 'interaction', 'query', 'results',
+    'participants', 'task', 'relevance', 'system', 'behaviour', 'session', 'documents', 'model',
+    'evaluation', 'interface', 'questions', 'analysis', 'data', 'experiment', 'effect', 'context'
+]
+
+FORENAMES = ['Ann', 'Bob', 'Carla', 'Dirk', 'Eva', 'Femke', 'Guus', 'Hanna']
+SURNAMES = ['Smith', 'Jones', 'de Vries', 'Jansen', 'Bakker', 'Visser', 'Smit', 'Meijer']
+
+
+class SyntheticTEIConfig:
+
+    def __init__(self, num_sections: int = 5, nesting_depth: int = 1, num_paragraphs: int = 3,
+                 num_sentences: int = 5, refs_per_sentence: int = 1, num_bibl_structs: int = 40,
+                 empty_ref_rate: float = 0.02, missing_target_rate: float = 0.02,
+                 missing_doi_rate: float = 0.5, seed: int = 0):
+        # num_paragraphs and num_sentences are per section and per paragraph,
+        # nesting_depth is the number of levels of subsection divs in each section
+        self.num_sections = num_sections
+        self.nesting_depth = nesting_depth
+        self.num_paragraphs = num_paragraphs
+        self.num_sentences = num_sentences
+        self.refs_per_sentence = refs_per_sentence
+        self.num_bibl_structs = num_bibl_structs
+        self.empty_ref_rate = empty_ref_rate
+        self.missing_target_rate = missing_target_rate
+        self.missing_doi_rate = missing_doi_rate
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def tei_sub(parent: Element, tag: str, text: str = None, **attrib) -> Element:
+    ele = SubElement(parent, parse_tei.make_tei_tag(tag), attrib)
+    ele.text = text
+    return ele
+
+
+def make_words(rng: random.Random, num_words: int):
+    return ' '.join(rng.choice(WORDS) for _ in range(num_words))
+
+
+def add_author(rng: random.Random, parent: Element):
+    author = tei_sub(parent, 'author')
+    pers_name = tei_sub(author, 'persName')
+    tei_sub(pers_name, 'forename', rng.choice(FORENAMES), type='first')
+    tei_sub(pers_name, 'surname', rng.choice(SURNAMES))
+
+
+def add_bibl_struct(rng: random.Random, parent: Element, config: SyntheticTEIConfig, bibl_id: str = None):
+    attrib = {parse_tei.make_tei_tag('id'): bibl_id} if bibl_id else {}
+    bibl_struct = SubElement(parent, parse_tei.make_tei_tag('biblStruct'), attrib)
+    title = make_words(rng, 6).capitalize()
+    analytic = tei_sub(bibl_struct, 'analytic')
+    tei_sub(analytic, 'title', title, level='a', type='main')
+    for _ in range(rng.randint(1, 4)):
+        add_author(rng, analytic)
+    if rng.random() >= config.missing_doi_rate:
+        tei_sub(analytic, 'idno', f"10.{rng.randint(1000, 9999)}/{rng.randint(10 ** 6, 10 ** 7)}", type='DOI')
+    monogr = tei_sub(bibl_struct, 'monogr')
+    tei_sub(monogr, 'title', make_words(rng, 3).title(), level='j')
+    imprint = tei_sub(monogr, 'imprint')
+    year = str(rng.randint(1990, 2023))
+    tei_sub(imprint, 'date', year, type='published', when=year)
+    tei_sub(bibl_struct, 'note', f"{rng.choice(SURNAMES)}. {year}. {title}.", type='raw_reference')
+    return bibl_struct
+
+
+def add_sentence(rng: random.Random, para: Element, config: SyntheticTEIConfig):
+    sent = tei_sub(para, 's', make_words(rng, rng.randint(4, 12)) + ' ')
+    for ri in range(config.refs_per_sentence):
+        if rng.random() < config.empty_ref_rate:
+            # an empty reference element, as GROBID sometimes produces
+            ref = tei_sub(sent, 'ref', type='bibr')
+        else:
+            bibl_index = rng.randrange(config.num_bibl_structs) if config.num_bibl_structs > 0 else 0
+            ref = tei_sub(sent, 'ref', f"[{bibl_index + 1}]", type='bibr')
+            if rng.random() >= config.missing_target_rate:
+                ref.attrib['target'] = f"#b{bibl_index}"
+        ref.tail = ' ' + make_words(rng, rng.randint(1, 5)) + ('.' if ri == config.refs_per_sentence - 1 else ' ')
+
+
+def add_div(rng: random.Random, parent: Element, config: SyntheticTEIConfig, number: str, depth: int):
+    div = tei_sub(parent, 'div')
+    tei_sub(div, 'head', make_words(rng, 3).capitalize(), n=number)
+    for _ in range(config.num_paragraphs):
+        para = tei_sub(div, 'p')
+        for _ in range(config.num_sentences):
+            add_sentence(rng, para, config)
+    if depth < config.nesting_depth:
+        add_div(rng, div, config, f"{number}.1", depth + 1)
+    return div
+
+
+def make_synthetic_tei(config: SyntheticTEIConfig) -> Element:
+    rng = random.Random(config.seed)
+    tei = Element(parse_tei.make_tei_tag('TEI'))
+    tei_header = tei_sub(tei, 'teiHeader')
+    file_desc = tei_sub(tei_header, 'fileDesc')
+    title_stmt = tei_sub(file_desc, 'titleStmt')
+    tei_sub(title_stmt, 'title', make_words(rng, 6).capitalize(), level='a', type='main')
+    source_desc = tei_sub(file_desc, 'sourceDesc')
+    add_bibl_struct(rng, source_desc, config)
+    text = tei_sub(tei, 'text')
+    body = tei_sub(text, 'body')
+    for si in range(config.num_sections):
+        add_div(rng, body, config, str(si + 1), 0)
+    back = tei_sub(text, 'back')
+    if config.num_bibl_structs == 0:
+        # a paper without a reference list
+        return tei
+    ref_div = tei_sub(back, 'div', type='references')
+    list_bibl = tei_sub(ref_div, 'listBibl')
+    for bi in range(config.num_bibl_structs):
+        add_bibl_struct(rng, list_bibl, config, bibl_id=f"b{bi}")
+    return tei
+
+
+def write_synthetic_tei(config: SyntheticTEIConfig, tei_file: str):
+    tree = ElementTree.ElementTree(make_synthetic_tei(config))
+    tree.write(tei_file, encoding='UTF-8', xml_declaration=True)
+
+
+def write_synthetic_corpus(config: SyntheticTEIConfig, tei_dir: str, num_docs: int) -> List[str]:
+    # files are named like GROBID output for scholar documents,
+    # <scholar_id>.<version>.grobid.tei.xml, with a different seed per file
+    os.makedirs(tei_dir, exist_ok=True)
+    tei_files = []
+    for di in range(num_docs):
+        doc_config = SyntheticTEIConfig(**{**config.to_dict(), 'seed': config.seed + di})
+        tei_file = os.path.join(tei_dir, f"synth{di:06d}.1.grobid.tei.xml")
+        write_synthetic_tei(doc_config, tei_file)
+        tei_files.append(tei_file)
+    return tei_files
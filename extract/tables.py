@@ -0,0 +1,57 @@
+import os
+from itertools import groupby
+from typing import Dict
+
+import pandas as pd
+
+import parse
+
+
+# columns used to join tables are read as strings, so that a table in which
+# all values of a column are empty still joins with the other tables
+ID_COLUMNS = {'doc_id', 'reference_id'}
+
+
+def read_citation_tables(table_dir: str) -> Dict[str, pd.DataFrame]:
+    tables = {}
+    for table_name, columns in parse.CITATION_TABLE_COLUMNS.items():
+        table_file = os.path.join(table_dir, f'{table_name}.tsv')
+        dtype = {column: str for column in columns if column in ID_COLUMNS}
+        tables[table_name] = pd.read_csv(table_file, sep='\t', dtype=dtype)
+    return tables
+
+
+def get_sentence_contexts(sentences: pd.DataFrame, context_size: int = 1):
+    # sentences of the same paragraph are stored consecutively, so each
+    # paragraph is joined once and every context is a slice of it
+    contexts = []
+    para_keys = zip(sentences['doc_id'], sentences['para_id'])
+    texts = sentences['text'].fillna('')
+    for _, para_group in groupby(zip(para_keys, texts), key=lambda item: item[0]):
+        sent_texts = [text for _, text in para_group]
+        para_text = ' '.join(sent_texts)
+        sent_starts, sent_ends = parse.get_sentence_offsets(sent_texts)
+        for si in range(len(sent_texts)):
+            contexts.append(parse.get_sentence_window(para_text, sent_starts, sent_ends, si, context_size))
+    return contexts
+
+
+def make_flat_citation_contexts(tables: Dict[str, pd.DataFrame], context_size: int = 1) -> pd.DataFrame:
+    # rebuild the flat layout of make_citation_context_csv from the normalized tables
+    sentences = tables['sentences'][['doc_id', 'sentence_id', 'section_id', 'text']].copy()
+    sentences['citation_context'] = get_sentence_contexts(tables['sentences'], context_size=context_size)
+    sentences = sentences.rename(columns={'text': 'citation_sent'})
+    flat = tables['citations'].merge(sentences, on=['doc_id', 'sentence_id'], how='left')
+    flat = flat.merge(tables['sections'], on=['doc_id', 'section_id'], how='left')
+    flat = flat.merge(tables['documents'], on='doc_id', how='left')
+    flat = flat.merge(tables['references'], on=['doc_id', 'reference_id'], how='left', indicator=True)
+    flat['cited_id'] = flat['cited_id'].astype(object).where(flat['_merge'] == 'both', 'MISSING')
+    flat['citation_ref'] = [
+        sent[start:end] for sent, start, end in zip(flat['citation_sent'], flat['char_start'], flat['char_end'])
+    ]
+    return flat[parse.CITATION_CONTEXT_COLUMNS]
+
+
+def read_flat_citation_contexts(table_dir: str, context_size: int = 1) -> pd.DataFrame:
+    tables = read_citation_tables(table_dir)
+    return make_flat_citation_contexts(tables, context_size=context_size)
@@ -0,0 +1,22 @@
+import pandas as pd
+
+import citation_graph
+import parse
+
+
+def test_section_weights_apply_to_subsections(nested_section_tei_files, tmp_path):
+    citation_context_file = str(tmp_path / 'citation_contexts.tsv')
+    parse.make_citation_context_csv(nested_section_tei_files, citation_context_file)
+    contexts = pd.read_csv(citation_context_file, sep='\t', dtype=str)
+    contexts = contexts[contexts['cited_work_id'].map(citation_graph.is_graph_id)]
+    in_related_work = contexts['section_title'].isin(['2 Related Work', '2 Related Work -- 2.1 User Studies'])
+    assert (contexts['section_title'] == '2 Related Work -- 2.1 User Studies').sum() > 0
+    graph = citation_graph.make_citation_graph(nested_section_tei_files)
+    assert graph.shape[0] == 2
+    assert graph.section_titles == ['introduction', 'related work', 'related work revisited']
+    assert graph.get_citation_matrix().sum() == len(contexts)
+    # the weight of a top-level section also applies to its subsections
+    matrix = graph.get_citation_matrix(section_weights={'2. Related Work': 0.0})
+    assert matrix.sum() == (~in_related_work).sum()
+    matrix = graph.get_citation_matrix(section_weights={'related work': 2.0}, default_weight=0.0)
+    assert matrix.sum() == 2 * in_related_work.sum()
@@ -0,0 +1,27 @@
+import pandas as pd
+
+import context_index
+import parse
+
+
+def make_index(tei_files, tmp_path) -> context_index.CitationContextIndex:
+    db_file = str(tmp_path / 'citation_contexts.db')
+    context_index.make_citation_context_db(tei_files, db_file)
+    return context_index.CitationContextIndex(db_file)
+
+
+def test_section_query_includes_subsections(nested_section_tei_files, tmp_path):
+    citation_context_file = str(tmp_path / 'citation_contexts.tsv')
+    parse.make_citation_context_csv(nested_section_tei_files, citation_context_file)
+    section_titles = pd.read_csv(citation_context_file, sep='\t', dtype=str)['section_title']
+    related_work = section_titles.isin(['2 Related Work', '2 Related Work -- 2.1 User Studies'])
+    user_studies = section_titles == '2 Related Work -- 2.1 User Studies'
+    assert user_studies.sum() > 0
+    with make_index(nested_section_tei_files, tmp_path) as index:
+        # '3 Related Work Revisited' shares the prefix of the title, but is another section
+        assert len(index.query(section='Related Work')) == related_work.sum()
+        assert len(index.query(section='2. RELATED WORK')) == related_work.sum()
+        assert len(index.query(section='related work -- user studies')) == user_studies.sum()
+        assert len(index.query(section='User Studies')) == 0
+        rows = index.get_section_contexts('related work', columns=['section_title'])
+        assert set(rows['section_title']) == {'2 Related Work', '2 Related Work -- 2.1 User Studies'}
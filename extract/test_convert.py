@@ -0,0 +1,64 @@
+import os
+
+import pandas as pd
+import pytest
+
+import convert
+import grobid_stub
+import parse
+import synthetic_tei
+
+
+TEI_CONFIG = synthetic_tei.SyntheticTEIConfig(num_sections=2, num_paragraphs=2, num_sentences=3,
+                                              num_bibl_structs=10)
+
+
+@pytest.fixture
+def grobid_server():
+    # the first request for each PDF is answered with 503, so every PDF is retried once
+    server = grobid_stub.start_stub_server(num_busy=1, tei_config=TEI_CONFIG)
+    yield server
+    server.shutdown()
+
+
+def write_pdfs(pdf_dir: str, names):
+    os.makedirs(pdf_dir, exist_ok=True)
+    for name in names:
+        with open(os.path.join(pdf_dir, name), 'wb') as fh:
+            fh.write(f"%PDF-1.4 {name}".encode('utf-8'))
+
+
+def read_sorted_rows(citation_context_file: str) -> pd.DataFrame:
+    # converted PDFs come back in any order
+    df = pd.read_csv(citation_context_file, sep='\t', dtype=str)
+    return df.sort_values(['doc_id', 'cit_count']).reset_index(drop=True)
+
+
+def run_convert(server, pdf_dir: str, tei_dir: str, citation_context_file: str):
+    results = convert.convert_pdf_dir(pdf_dir, tei_dir, citation_context_file=citation_context_file,
+                                      grobid_server=f"http://localhost:{server.server_port}",
+                                      sleep_time=0, concurrency=2)
+    return {os.path.basename(pdf_file): status for pdf_file, tei_file, status, error in results}
+
+
+def test_convert_pdf_dir_rerun_keeps_contexts_of_skipped_pdfs(grobid_server, tmp_path):
+    pdf_dir, tei_dir = str(tmp_path / 'pdf'), str(tmp_path / 'tei')
+    citation_context_file = str(tmp_path / 'citation_contexts.tsv')
+    # the hidden ._ file is not a PDF and is never sent
+    write_pdfs(pdf_dir, ['a.pdf', 'b.PDF', '._a.pdf'])
+    statuses = run_convert(grobid_server, pdf_dir, tei_dir, citation_context_file)
+    assert statuses == {'a.pdf': 'converted', 'b.PDF': 'converted'}
+    assert grobid_server.num_requests == 4
+    write_pdfs(pdf_dir, ['c.pdf'])
+    statuses = run_convert(grobid_server, pdf_dir, tei_dir, citation_context_file)
+    assert statuses == {'a.pdf': 'skipped', 'b.PDF': 'skipped', 'c.pdf': 'converted'}
+    # the contexts extracted from the responses and from the skipped TEI files
+    # are the same as those extracted from all TEI files afterwards
+    tei_files = sorted(os.path.join(tei_dir, fname) for fname in os.listdir(tei_dir))
+    assert [os.path.basename(tei_file) for tei_file in tei_files] == [
+        'a.grobid.tei.xml', 'b.grobid.tei.xml', 'c.grobid.tei.xml']
+    expected_file = str(tmp_path / 'expected.tsv')
+    parse.make_citation_context_csv(tei_files, expected_file)
+    rows = read_sorted_rows(citation_context_file)
+    assert set(rows['doc_id']) == set(tei_files)
+    pd.testing.assert_frame_equal(rows, read_sorted_rows(expected_file))
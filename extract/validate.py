@@ -1,71 +1,141 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List
 from xml.etree.ElementTree import Element
 
+import archives
 import parse_tei
 
 
-def validate_assumptions(tei_text):
-    validate_text_assumptions(tei_text)
-    validate_author_assumptions(tei_text)
-    validate_bibliographic_assumptions(tei_text)
-    validate_reference_assumptions(tei_text)
-
-
-def validate_text_assumptions(tei_text):
-    assert_para_has_only_sents(tei_text)
-    assert_sent_has_only_refs(tei_text)
-
-
-def validate_author_assumptions(tei_text: Element):
-    author_tag = parse_tei.make_tei_tag('author')
-    expected_author_tags = {parse_tei.make_tei_tag(tag) for tag in parse_tei.AUTHOR_FIELDS}
-    expected_person_tags = {parse_tei.make_tei_tag(tag) for tag in parse_tei.PERSONAME_FIELDS}
-    for author_ele in tei_text.iter(author_tag):
-        for child in author_ele:
-            assert child.tag in expected_author_tags, f"unexpected tag in author: '{child.tag}'"
-            if parse_tei.has_tag(child, 'persName'):
-                for name in child:
-                    assert name.tag in expected_person_tags, f"unexpected tag in persName: '{child.tag}'"
-
-
-def validate_reference_assumptions(tei_text: Element):
-    ref_elements = parse_tei.get_elements_by_tag(tei_text, 'ref')
-
-    for ref_ele in ref_elements:
-        assert ref_ele.attrib['type'] in parse_tei.REF_TYPES, f"unexpected reference type '{ref_ele.attrib['type']}'."
-
-
-def validate_bibliographic_assumptions(tei_text: Element):
-    list_bibl = parse_tei.get_elements_by_tag(tei_text, 'listBibl')[0]
-    bibl_structs = parse_tei.get_elements_by_tag(list_bibl, 'biblStruct')
-    for bibl_struct in bibl_structs:
-        analytic = parse_tei.get_element_by_tag(bibl_struct, 'analytic')
-        monogr = parse_tei.get_element_by_tag(bibl_struct, 'monogr')
-        assert monogr is not None, f"bibliographic entry has no monogr element: {parse_tei.make_bibl_string(bibl_struct)}"
-        if analytic:
-            expected_analytic_tags = {parse_tei.make_tei_tag(tag) for tag in parse_tei.ANALYTIC_FIELDS}
-            for child in analytic:
-                assert child.tag in expected_analytic_tags, f"unexpected tag in analytic: '{child.tag}'"
-        expected_monogr_tags = {parse_tei.make_tei_tag(tag) for tag in parse_tei.MONOGR_FIELDS}
-        for child in monogr:
-            assert child.tag in expected_monogr_tags, f"unexpected tag in monogr: '{child.tag}'"
-        imprint = parse_tei.get_element_by_tag(monogr, 'imprint')
-        if imprint:
-            expected_imprint_tags = {parse_tei.make_tei_tag(tag) for tag in parse_tei.IMPRINT_FIELDS}
-            for child in imprint:
-                assert child.tag in expected_imprint_tags, f"unexpected tag in imprint: '{child.tag}'"
-
-def assert_para_has_only_sents(tei_text: Element):
-    para_tag = parse_tei.make_tei_tag('p')
-    sent_tag = parse_tei.make_tei_tag('s')
-    for para in tei_text.iter(para_tag):
-        for sent in para:
-            assert sent.tag == sent_tag, f"paragraph contains an element tag other than s: '{sent.tag}'"
-    return None
-
-
-def assert_sent_has_only_refs(tei_text: Element):
-    sent_tag = parse_tei.make_tei_tag('s')
-    ref_tag = parse_tei.make_tei_tag('ref')
-    for sent in tei_text.iter(sent_tag):
-        for ref in sent:
-            assert ref.tag == ref_tag, f"sententce contains an element tag other than ref: '{ref.tag}'"
+FINDING_COLUMNS = ['doc_id', 'rule', 'tag', 'message']
+
+PARA_TAG = parse_tei.make_tei_tag('p')
+SENT_TAG = parse_tei.make_tei_tag('s')
+REF_TAG = parse_tei.make_tei_tag('ref')
+AUTHOR_TAG = parse_tei.make_tei_tag('author')
+PERSNAME_TAG = parse_tei.make_tei_tag('persName')
+LIST_BIBL_TAG = parse_tei.make_tei_tag('listBibl')
+BIBL_STRUCT_TAG = parse_tei.make_tei_tag('biblStruct')
+ANALYTIC_TAG = parse_tei.make_tei_tag('analytic')
+MONOGR_TAG = parse_tei.make_tei_tag('monogr')
+IMPRINT_TAG = parse_tei.make_tei_tag('imprint')
+
+EXPECTED_AUTHOR_TAGS = {parse_tei.make_tei_tag(tag) for tag in parse_tei.AUTHOR_FIELDS}
+EXPECTED_PERSON_TAGS = {parse_tei.make_tei_tag(tag) for tag in parse_tei.PERSONAME_FIELDS}
+EXPECTED_ANALYTIC_TAGS = {parse_tei.make_tei_tag(tag) for tag in parse_tei.ANALYTIC_FIELDS}
+EXPECTED_MONOGR_TAGS = {parse_tei.make_tei_tag(tag) for tag in parse_tei.MONOGR_FIELDS}
+EXPECTED_IMPRINT_TAGS = {parse_tei.make_tei_tag(tag) for tag in parse_tei.IMPRINT_FIELDS}
+
+
+def make_finding(rule: str, tag: str, message: str):
+    return {'rule': rule, 'tag': parse_tei.clean_tag(tag) if tag else tag, 'message': message}
+
+
+def check_children(ele: Element, expected_tags: set, rule: str, label: str, findings: List[dict]):
+    for child in ele:
+        if child.tag not in expected_tags:
+            findings.append(make_finding(rule, child.tag, f"unexpected tag in {label}: '{child.tag}'"))
+
+
+def check_author(author_ele: Element, findings: List[dict]):
+    check_children(author_ele, EXPECTED_AUTHOR_TAGS, 'author_child', 'author', findings)
+    for child in author_ele:
+        if child.tag == PERSNAME_TAG:
+            check_children(child, EXPECTED_PERSON_TAGS, 'persname_child', 'persName', findings)
+
+
+def check_ref(ref_ele: Element, findings: List[dict]):
+    ref_type = ref_ele.attrib.get('type')
+    if ref_type not in parse_tei.REF_TYPES:
+        findings.append(make_finding('ref_type', ref_type, f"unexpected reference type '{ref_type}'."))
+
+
+def check_bibl_struct(bibl_struct: Element, findings: List[dict]):
+    if any(child.tag == MONOGR_TAG for child in bibl_struct) is False:
+        message = f"bibliographic entry has no monogr element: {parse_tei.make_bibl_string(bibl_struct)}"
+        findings.append(make_finding('bibl_monogr', None, message))
+
+
+def check_element(ele: Element, in_list_bibl: bool, findings: List[dict]):
+    if ele.tag == PARA_TAG:
+        check_children(ele, {SENT_TAG}, 'para_child', 'paragraph', findings)
+    elif ele.tag == SENT_TAG:
+        check_children(ele, {REF_TAG}, 'sent_child', 'sentence', findings)
+    elif ele.tag == AUTHOR_TAG:
+        check_author(ele, findings)
+    elif ele.tag == REF_TAG:
+        check_ref(ele, findings)
+    elif in_list_bibl is False:
+        return None
+    elif ele.tag == BIBL_STRUCT_TAG:
+        check_bibl_struct(ele, findings)
+    elif ele.tag == ANALYTIC_TAG:
+        check_children(ele, EXPECTED_ANALYTIC_TAGS, 'analytic_child', 'analytic', findings)
+    elif ele.tag == MONOGR_TAG:
+        check_children(ele, EXPECTED_MONOGR_TAGS, 'monogr_child', 'monogr', findings)
+    elif ele.tag == IMPRINT_TAG:
+        check_children(ele, EXPECTED_IMPRINT_TAGS, 'imprint_child', 'imprint', findings)
+
+
+def validate_tei_text(tei_text: Element) -> List[dict]:
+    # checks all the assumptions in a single walk over the tree, in document
+    # order, and collects every problem instead of stopping at the first one.
+    # The bibliographic rules apply to the first listBibl only.
+    findings = []
+    list_bibl_seen = False
+    stack = [(tei_text, False)]
+    while len(stack) > 0:
+        ele, in_list_bibl = stack.pop()
+        if ele.tag == LIST_BIBL_TAG and list_bibl_seen is False:
+            list_bibl_seen = True
+            in_list_bibl = True
+        check_element(ele, in_list_bibl, findings)
+        stack.extend([(child, in_list_bibl) for child in reversed(ele)])
+    if list_bibl_seen is False:
+        findings.append(make_finding('list_bibl', None, 'text has no listBibl element'))
+    return findings
+
+
+def validate_assumptions(tei_text: Element):
+    findings = validate_tei_text(tei_text)
+    if len(findings) > 0:
+        messages = '\n'.join([finding['message'] for finding in findings])
+        raise ValueError(f"TEI text violates {len(findings)} assumptions:\n{messages}")
+
+
+def validate_tei_file(tei_file: str):
+    # runs in a worker process, errors are returned per file like the
+    # findings, so one malformed TEI file doesn't stop the corpus run
+    try:
+        tei_header, tei_text = parse_tei.parse_tei_file(tei_file)
+        return tei_file, validate_tei_text(tei_text), None
+    except Exception as err:
+        return tei_file, None, f"{err.__class__.__name__}: {err}"
+
+
+def iter_validated_files(tei_files: Iterable[str], num_workers: int = None, chunk_size: int = 10):
+    if num_workers is None:
+        for tei_file in tei_files:
+            yield validate_tei_file(tei_file)
+        return None
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        yield from executor.map(validate_tei_file, tei_files, chunksize=chunk_size)
+
+
+def iter_finding_rows(tei_file: str, findings: List[dict]):
+    for finding in findings:
+        yield [tei_file] + [finding[column] for column in FINDING_COLUMNS[1:]]
+
+
+def validate_corpus(tei_files: Iterable[str], num_workers: int = None, chunk_size: int = 10):
+    tei_files = archives.iter_tei_files(tei_files)
+    rows = []
+    try:
+        for tei_file, findings, error in iter_validated_files(tei_files, num_workers=num_workers,
+                                                              chunk_size=chunk_size):
+            if error is not None:
+                rows.append([tei_file, 'parse_error', None, error])
+                continue
+            rows.extend(iter_finding_rows(tei_file, findings))
+    finally:
+        archives.close_archives()
+    return rows
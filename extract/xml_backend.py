@@ -0,0 +1,70 @@
+import os
+import xml.etree.ElementTree as ElementTree
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+# The TEI files can be parsed with lxml or with the ElementTree module of
+# the standard library. Both give elements with the same tag, attrib, text
+# and tail, and both leave out comments and processing instructions, so the
+# extracted rows are the same either way. lxml parses about twice as fast,
+# but the element access of the section and reference parsing is about twice
+# as slow (see benchmark.py), so the standard library is the default.
+# The environment variable TEI_XML_BACKEND ('lxml' or 'stdlib') picks a
+# backend, it is also how worker processes get the backend of the main process.
+# If lxml is picked but not installed, the standard library is used.
+
+BACKENDS = ['lxml', 'stdlib']
+BACKEND_ENV = 'TEI_XML_BACKEND'
+
+
+def get_available_backends():
+    return [backend for backend in BACKENDS if backend != 'lxml' or etree is not None]
+
+
+def check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown XML backend '{backend}', must be one of {BACKENDS}")
+    if backend == 'lxml' and etree is None:
+        raise ValueError("XML backend 'lxml' is not available, install lxml or use 'stdlib'")
+    return backend
+
+
+def get_backend() -> str:
+    backend = os.environ.get(BACKEND_ENV, 'stdlib')
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown XML backend '{backend}' in {BACKEND_ENV}, must be one of {BACKENDS}")
+    return backend if backend in get_available_backends() else 'stdlib'
+
+
+def set_backend(backend: str):
+    os.environ[BACKEND_ENV] = check_backend(backend)
+
+
+def make_lxml_parser_args():
+    # no entity expansion or network access for the TEI from GROBID
+    return {'remove_comments': True, 'remove_pis': True, 'resolve_entities': False, 'huge_tree': True}
+
+
+def parse(source):
+    # source is a file name or a file object, returns the root element
+    if get_backend() == 'lxml':
+        return etree.parse(source, etree.XMLParser(**make_lxml_parser_args())).getroot()
+    return ElementTree.parse(source).getroot()
+
+
+def iterparse(source, events=('end',)):
+    if get_backend() == 'lxml':
+        return etree.iterparse(source, events=events, **make_lxml_parser_args())
+    return ElementTree.iterparse(source, events=events)
+
+
+def iter_elements(root):
+    # all elements of the tree in document order, root included. Decided by
+    # the element type, so it works for a tree made before the backend changed.
+    if etree is not None and isinstance(root, etree._Element):
+        return root.iter(etree.Element)
+    return root.iter()